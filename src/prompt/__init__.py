@@ -1,4 +1,24 @@
-from .ui import prompt
+import os
+import sys
+
+
+def main() -> None:
+    """Console script entry point.
+
+    `prompt ps1` runs for every prompt, so it is handled here without
+    building the click CLI.  Everything else, including a timed ps1, goes
+    through ui.prompt.
+    """
+    if sys.argv[1:] == ["ps1"] and not os.environ.get("PROMPT_TIME"):
+        from .prompt import cached_ps1_prompt
+
+        sys.stdout.write(f"\n{cached_ps1_prompt()}\n")
+        return
+
+    from .ui import prompt
 
-if __name__ == "__main__":
     prompt()
+
+
+if __name__ == "__main__":
+    main()
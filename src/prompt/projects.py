@@ -2,15 +2,77 @@ import os
 import sys
 import re
 import click
-import csv
-import getpass
-import random
-import colorsys
+import functools
+import mmap
 from pathlib import Path
+from collections.abc import Iterable
 
 
 CONFIG_FILE = "~/.prompt-projects"
 
+_BUFSIZE = 1 << 20
+# Below this size a plain read() is cheaper than setting up an mmap.
+_MMAP_MIN = 64 * 1024
+
+# SGR foreground codes for the basic colors click.style also accepts.
+_FG_CODES = {
+    "black": "30",
+    "red": "31",
+    "green": "32",
+    "yellow": "33",
+    "blue": "34",
+    "magenta": "35",
+    "cyan": "36",
+    "white": "37",
+}
+_RESET = "\x1b[0m"
+
+# Lightness and saturation choices for random project colors.
+_LIGHTNESS = (0.15, 0.2, 0.25, 0.3)
+_SATURATION = (0.1, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+def _ls_variant(light: float, sat: float) -> tuple[float, float]:
+    # colorsys.hls_to_rgb up to the per channel _v() calls
+    if light <= 0.5:
+        m2 = light * (1.0 + sat)
+    else:
+        m2 = light + sat - (light * sat)
+    return 2.0 * light - m2, m2
+
+
+# Only the hue is continuous, so the lightness/saturation dependent part of
+# colorsys.hls_to_rgb, the (m1, m2) pair, is worked out once per combination.
+_LS_VARIANTS = tuple(
+    _ls_variant(light, sat) for light in _LIGHTNESS for sat in _SATURATION
+)
+
+# Parsed config keyed by file path, valid while (st_mtime_ns, st_size) match.
+_CACHE: dict[str, tuple[tuple[int, int], dict[str, list[str]]]] = {}
+
+
+@functools.lru_cache
+def _sgr(bold: bool, dim: bool, fg: str | None) -> str:
+    codes = []
+    if bold:
+        codes.append("1")
+    if dim:
+        codes.append("2")
+    if fg:
+        codes.append(_FG_CODES[fg])
+    return f"\x1b[{';'.join(codes)}m" if codes else ""
+
+
+def _ansi(
+    text: str, *, bold: bool = False, dim: bool = False, fg: str | None = None
+) -> str:
+    """A cut down click.style for hot loops.
+
+    The escape prefix for each style combination is only built once.
+    """
+    prefix = _sgr(bold, dim, fg)
+    return f"{prefix}{text}{_RESET}" if prefix else text
+
 
 def error(msg: str) -> None:
     err = click.style("Error:", bold=True, fg="red")
@@ -19,29 +81,84 @@ def error(msg: str) -> None:
     sys.exit(1)
 
 
+def _datafile() -> str:
+    """Return CONFIG_FILE with ~ expanded.
+
+    CONFIG_FILE is read on each call rather than hoisted into a constant so
+    tests can point it at a temp file.
+    """
+    return os.path.expanduser(CONFIG_FILE)
+
+
+def _parse_rows(lines: Iterable[bytes]) -> dict[str, list[str]]:
+    # Plain tab separated rows, no quoting, so skip the csv module.
+    data: dict[str, list[str]] = {}
+    for line in lines:
+        line = line.rstrip(b"\r\n")
+        if not line or line[:1] == b"#":
+            continue
+        row = line.split(b"\t", 3)
+        if len(row) >= 3:
+            data[row[0].decode()] = [row[1].decode(), row[2].decode()]
+    return data
+
+
 def read_csv() -> dict[str, list[str]]:
-    datafile = os.path.expanduser(CONFIG_FILE)
-    data = {}
+    datafile = _datafile()
+    data: dict[str, list[str]] = {}
     try:
-        with open(datafile, newline="") as f:
-            reader = csv.reader(f, delimiter="\t")
-            for row in reader:
-                if row and not row[0].startswith("#"):
-                    data[row[0]] = [row[1], row[2]]
+        st = os.stat(datafile)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = _CACHE.get(datafile)
+        if cached and cached[0] == key:
+            # callers (add_line) mutate the dict, so hand out a copy
+            return dict(cached[1])
+        with open(datafile, "rb", buffering=_BUFSIZE) as f:
+            if st.st_size >= _MMAP_MIN:
+                # large file, parse straight out of the page cache
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = _parse_rows(iter(mm.readline, b""))
+            else:
+                data = _parse_rows(f.read().splitlines())
     except FileNotFoundError:
         error(f"projects list ({datafile}) not found.")
 
-    data = dict(sorted(data.items(), key=lambda item: item[1]))
-    return data
+    _CACHE[datafile] = (key, data)
+    return dict(data)
+
+
+read_csv.cache_clear = _CACHE.clear  # type: ignore[attr-defined]
+
+
+def _cache_store(datafile: str, odict: dict[str, list[str]]) -> None:
+    """Prime the read cache with a dict that was just written to disk."""
+    st = os.stat(datafile)
+    _CACHE[datafile] = ((st.st_mtime_ns, st.st_size), dict(odict))
+
+
+def _format_row(name: str, project_info: list[str]) -> str:
+    # Fields are written unquoted, see _parse_rows
+    return f"{name}\t{project_info[0]}\t{project_info[1]}\n"
 
 
 def write_csv(odict: dict[str, list[str]]) -> None:
-    datafile = os.path.expanduser(CONFIG_FILE)
-    data = [[i, j[0], j[1]] for i, j in odict.items()]
-    with open(datafile, "w", newline="") as f:
-        writer = csv.writer(f, delimiter="\t")
-        for line in data:
-            writer.writerow(line)
+    datafile = _datafile()
+    data = "".join(_format_row(i, j) for i, j in odict.items())
+    with open(datafile, "w", newline="", buffering=_BUFSIZE) as f:
+        f.write(data)
+    _cache_store(datafile, odict)
+
+
+def append_csv(name: str, project_info: list[str]) -> None:
+    """Append a single project row without rewriting the whole file."""
+    datafile = _datafile()
+    with open(datafile, "ab+") as f:
+        # a hand edited file might be missing its final newline
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write(_format_row(name, project_info).encode())
 
 
 def _find_worktree_root(pwd: Path) -> Path | None:
@@ -66,25 +183,31 @@ def _find_worktree_root(pwd: Path) -> Path | None:
 
 
 def get_project_dir(projects: dict[str, list[str]]) -> str | bool:
-    pwd = Path(os.path.realpath(os.path.curdir))
-
-    # Check if we're inside a worktree branch
-    worktree_root = _find_worktree_root(pwd)
-
-    for project, project_info in projects.items():
-        path = Path(project_info[0])
-        if pwd == path:
+    pwd = os.path.realpath(os.path.curdir)
+    pwd_sep = pwd if pwd.endswith(os.sep) else pwd + os.sep
+
+    # Deepest project first so a nested project wins over its parent and
+    # the first match can be returned straight away.
+    roots = sorted(
+        (str(Path(project_info[0])) for project_info in projects.values()),
+        key=len,
+        reverse=True,
+    )
+    for root in roots:
+        root_sep = root if root.endswith(os.sep) else root + os.sep
+        if pwd_sep == root_sep:
             # is in root of project and the user
             # probably wants to change projects
             return False
-        if pwd.is_relative_to(path):  #  pwd.startswith(path):
+        if pwd_sep.startswith(root_sep):
             # If in a worktree branch, cd to the worktree root
             # instead of the registered project root
-            if worktree_root and pwd != worktree_root:
+            worktree_root = _find_worktree_root(Path(pwd))
+            if worktree_root and Path(pwd) != worktree_root:
                 return str(worktree_root)
             # is in a subdir of a project and
             # the user probably want to go to root
-            return str(path)
+            return root
     return False
 
 
@@ -92,44 +215,79 @@ def add_line(name: str, project_root: Path, color: str) -> None:
     if not color:
         color = get_random_color()
 
-    edit = False
+    # the file is unquoted, so these would silently split or merge rows
+    if any(c in name or c in str(project_root) for c in "\t\r\n"):
+        error("Project name and path can't contain tabs or newlines.")
+
     projects = read_csv()
-    for project in projects:
-        if project == name:
-            click.echo(f"New color: {color}")
-            path = projects[project][0]
-            projects[project] = [path, color]
-            edit = True
-    if not edit:
+    if name in projects:
+        click.echo(f"New color: {color}")
+        path = projects[name][0]
+        projects[name] = [path, color]
+        write_csv(projects)
+    else:
         projects[name] = [str(project_root.absolute()), color]
-    write_csv(projects)
+        append_csv(name, projects[name])
+        _cache_store(_datafile(), projects)
 
 
 def filter_projects(
     projects: dict[str, list[str]], project: str
 ) -> dict[str, list[str]]:
+    needle = project.lower()
     filtered = {
-        key: val
-        for key, val in projects.items()
-        if key.lower().startswith(project.lower())
+        key: val for key, val in projects.items() if key.lower().startswith(needle)
     }
     return filtered
 
 
+def _existing_paths(paths: Iterable[str]) -> set[str]:
+    """Return the subset of paths that exist.
+
+    Projects usually share a few parent dirs (~/src, ~/work) so each parent
+    is listed once with scandir rather than stat'ing every project. The
+    listing can only confirm a dir, anything it doesn't show as one
+    (dangling symlink, a name that differs in case, an unlistable parent)
+    falls back to os.path.exists.
+    """
+    by_parent: dict[str, list[tuple[str, str]]] = {}
+    existing = set()
+    for path in paths:
+        parent, base = os.path.split(os.path.normpath(path))
+        if base:
+            by_parent.setdefault(parent, []).append((path, base))
+        elif os.path.exists(path):
+            existing.add(path)  # the root dir
+    for parent, children in by_parent.items():
+        try:
+            with os.scandir(parent) as it:
+                entries = {entry.name: entry for entry in it}
+        except OSError:
+            entries = {}  # no read permission, flaky mount
+        for path, base in children:
+            entry = entries.get(base)
+            if (entry is not None and entry.is_dir()) or os.path.exists(path):
+                existing.add(path)
+    return existing
+
+
 def pretty_print(projects: dict[str, list[str]]) -> None:
-    out = []
-    for name, project_info in projects.items():
+    """Write the project list to stderr.
+
+    stdout is eval'd by the cdd shell function, so the listing goes to
+    stderr where it's shown as-is instead of being wrapped in a printf.
+    """
+    import getpass
+
+    write = sys.stderr.write
+    home_re = re.compile(f"^/home/{re.escape(getpass.getuser())}")
+    existing = _existing_paths(info[0] for info in projects.values())
+    for name, project_info in sorted(projects.items(), key=lambda item: item[1]):
         path = project_info[0]
-        name = name.ljust(15)
-        name = click.style(name, bold=True)
-        username = getpass.getuser()
-        missing = None if os.path.exists(path) else "red"
-        path = re.sub(f"^/home/{username}", "~", path)
-        path = click.style(path, dim=True, fg=missing)
-        out.append(f"{name}  {path}\\n")
-    joined_out = "".join(out)
-    formated_out = f'printf "{joined_out}"'
-    print(formated_out)
+        name = _ansi(name.ljust(15), bold=True)
+        missing = None if path in existing else "red"
+        path = _ansi(home_re.sub("~", path), dim=True, fg=missing)
+        write(f"{name}  {path}\n")
 
 
 def print_list(projects: dict[str, list[str]]) -> None:
@@ -137,18 +295,27 @@ def print_list(projects: dict[str, list[str]]) -> None:
     print(f'printf "{pretty}"')
 
 
-def get_random_color() -> str:
-    hue = round(random.random(), 3)  # between 0 and 1
-    value = random.choice([0.15, 0.2, 0.25, 0.3])
-    saturation = random.choice([0.1, 0.2, 0.4, 0.6, 0.8, 1])
-    rgb = colorsys.hls_to_rgb(hue, value, saturation)
-    scaled_rgb = [round(scale_to_255(i)) for i in rgb]
-    hex_color = "#{0:02x}{1:02x}{2:02x}".format(*scaled_rgb)
-    return hex_color
+def _hue_to_channel(m1: float, m2: float, hue: float) -> float:
+    # colorsys._v, one channel of hls_to_rgb
+    hue %= 1.0
+    if hue < 1 / 6:
+        return m1 + (m2 - m1) * hue * 6.0
+    if hue < 0.5:
+        return m2
+    if hue < 2 / 3:
+        return m1 + (m2 - m1) * (2 / 3 - hue) * 6.0
+    return m1
 
 
-def scale_to_255(i: float) -> float:
-    return (i * 100) * 255 / 100
+def get_random_color() -> str:
+    import random
+
+    m1, m2 = random.choice(_LS_VARIANTS)
+    hue = random.random()  # between 0 and 1
+    r = _hue_to_channel(m1, m2, hue + 1 / 3)
+    g = _hue_to_channel(m1, m2, hue)
+    b = _hue_to_channel(m1, m2, hue - 1 / 3)
+    return f"#{int(r * 255 + 0.5):02x}{int(g * 255 + 0.5):02x}{int(b * 255 + 0.5):02x}"
 
 
 class ColorParamType(click.ParamType):
@@ -164,24 +331,21 @@ class ColorParamType(click.ParamType):
         "black",
     ]
     hex_colors = "^#(?:[0-9a-fA-F]{3}){1,2}$"
+    _named_set = frozenset(named_colors)
+    _hex_re = re.compile(hex_colors)
 
     def convert(
         self, value: str, param: click.Parameter | None, ctx: click.Context | None
     ) -> str:
-        is_color = False
-        if value in self.named_colors:
-            is_color = True
-        elif re.search(self.hex_colors, value):
-            is_color = True
-
-        if not is_color:
-            named_colors = ", ".join(self.named_colors)
-            self.fail(
-                f'"{value}" is not a named color \n({named_colors}) or hex color (#ffffff)',
-                param,
-                ctx,
-            )
-        return value
+        if value in self._named_set or self._hex_re.match(value):
+            return value
+
+        named_colors = ", ".join(self.named_colors)
+        self.fail(
+            f'"{value}" is not a named color \n({named_colors}) or hex color (#ffffff)',
+            param,
+            ctx,
+        )
 
 
 COLOR_TYPE = ColorParamType()
@@ -256,7 +420,7 @@ def cd(project: str) -> None:
             pretty_print(projects)
             error(f"No project match for: {project}")
         else:
-            project_info = list(matching.values())[0]
+            project_info = next(iter(matching.values()))
             path = project_info[0]
             print(f"cd {path}")
 
@@ -289,14 +453,27 @@ def remove(name: str) -> None:
 
     NAME must be the full name of the project.
     """
-    datafile = os.path.expanduser(CONFIG_FILE)
-    with open(datafile, "r") as f:
+    # resolve symlinks so os.replace doesn't clobber a linked dotfile
+    datafile = os.path.realpath(_datafile())
+    with open(datafile, "r", buffering=_BUFSIZE) as f:
         contents = f.readlines()
 
-    with open(datafile, "w") as f:
-        for line in contents:
-            if not line.startswith(f"{name}\t"):
-                f.write(line)
+    import shutil
+    import tempfile
+
+    prefix = f"{name}\t"
+    # a unique tmp file so concurrent removes can't write over each other
+    fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(datafile))
+    try:
+        with open(fd, "w", buffering=_BUFSIZE) as f:
+            f.writelines(line for line in contents if not line.startswith(prefix))
+        # keep the data file's permissions rather than mkstemp's 0600
+        shutil.copymode(datafile, tmpfile)
+        os.replace(tmpfile, datafile)
+    except BaseException:
+        os.unlink(tmpfile)
+        raise
+    _CACHE.pop(_datafile(), None)
 
 
 # if __name__ == "__main__":
@@ -1,22 +1,23 @@
-import csv
-import datetime
-import hashlib
+import functools
 import os
-import random
 import re
-import socket
-import subprocess
+import stat
 import sys
-import json
-from dataclasses import dataclass, fields
+from collections.abc import Mapping
 from enum import Enum, auto
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 import click
 from pprint import pprint as pp  # noqa: F401
 import colorsys
 from typing import Tuple
 
+if TYPE_CHECKING:
+    import subprocess
+
+# Everything that is only needed by some chunks is imported where it's used
+# since this module is loaded fresh for every prompt.
+
 
 class Segment(Enum):
     POETRY = auto()
@@ -47,6 +48,7 @@ class Enviroment(Enum):
     DOCKER = auto()
 
 
+@functools.lru_cache(maxsize=1)
 def get_theme() -> dict[Any, Any]:
     remote = "Remote"
     local = "Local"
@@ -59,6 +61,7 @@ def get_theme() -> dict[Any, Any]:
         return themes[local]
 
 
+@functools.lru_cache(maxsize=1)
 def get_environment() -> Enviroment:
     location = Enviroment.LOCAL
 
@@ -69,16 +72,23 @@ def get_environment() -> Enviroment:
     return location
 
 
+@functools.lru_cache(maxsize=1)
 def is_orb() -> bool:
     home = os.getenv("HOME", "")
-    orb_path = Path("/Users")
-    if orb_path.exists() and "/home/sm" in home:
-        return True
-    return False
+    # Check the string first so most machines skip the stat
+    return "/home/sm" in home and Path("/Users").exists()
+
+
+@functools.lru_cache(maxsize=1)
+def get_hostname() -> str:
+    """Return the hostname, gethostname() can be slow on a misconfigured host."""
+    import socket
+
+    return socket.gethostname()
 
 
-@dataclass
 class Ellipses:
+    # Only the annotated names are listed by list_fields() and list_values()
     unicode_ellipsis: str = "…"  # "\u2026"
     ascii_ellipsis: str = "..."
     bar: str = "|"
@@ -104,15 +114,21 @@ class Ellipses:
 
     @staticmethod
     def list_fields() -> list[str]:
-        return [f.name for f in fields(Ellipses)]
+        return list(_ELLIPSES_FIELDS)
 
     @staticmethod
     def list_values() -> list[str]:
-        return [str(field.default) for field in fields(Ellipses)]
+        return list(_ELLIPSES_VALUES)
 
     @staticmethod
     def random() -> str:
-        return random.choice(Ellipses.list_values())
+        import random
+
+        return random.choice(_ELLIPSES_VALUES)
+
+
+_ELLIPSES_FIELDS = tuple(Ellipses.__annotations__)
+_ELLIPSES_VALUES = tuple(getattr(Ellipses, name) for name in _ELLIPSES_FIELDS)
 
 
 def hsl(h: float, s: float, l: float) -> tuple[int, int, int]:
@@ -180,6 +196,64 @@ themes: dict[str, dict[Segment | str, dict[str, Any]]] = {
 }
 
 
+RESET = "\x1b[0m"
+TRUECOLOR = os.environ.get("COLORTERM") in ("truecolor", "24bit")
+
+
+def _cube_index(value: int) -> int:
+    """Return the closest of the xterm color cube levels 0, 95, 135...255"""
+    if value < 48:
+        return 0
+    if value < 115:
+        return 1
+    return (value - 35) // 40
+
+
+def rgb_to_256(rgb: tuple[int, int, int]) -> int:
+    """Return the closest xterm 256 color index for an RGB tuple.
+
+    Picks whichever is nearer, the 6x6x6 color cube or the grey ramp.
+    """
+    r, g, b = rgb
+    levels = (0, 95, 135, 175, 215, 255)
+    ri, gi, bi = _cube_index(r), _cube_index(g), _cube_index(b)
+    cr, cg, cb = levels[ri], levels[gi], levels[bi]
+    cube_dist = (r - cr) ** 2 + (g - cg) ** 2 + (b - cb) ** 2
+
+    grey_index = min(23, max(0, ((r + g + b) // 3 - 3) // 10))
+    grey = 8 + 10 * grey_index
+    grey_dist = (r - grey) ** 2 + (g - grey) ** 2 + (b - grey) ** 2
+
+    if grey_dist < cube_dist:
+        return 232 + grey_index
+    return 16 + 36 * ri + 6 * gi + bi
+
+
+@functools.cache
+def style_codes(
+    fg: str | int | tuple[int, int, int],
+    bg: str | int | tuple[int, int, int],
+    bold: bool = False,
+    italic: bool = False,
+    ul: bool = False,
+) -> str:
+    """Return the escape codes click.style() puts in front of styled text.
+
+    Each distinct style is only built once, the brackets and chunks of the
+    prompt then just wrap their text with these codes and RESET.  RGB colors
+    are reduced to the 256 color palette unless $COLORTERM says the terminal
+    does truecolor.
+    """
+    if not TRUECOLOR:
+        if isinstance(fg, tuple):
+            fg = rgb_to_256(fg)
+        if isinstance(bg, tuple):
+            bg = rgb_to_256(bg)
+    return click.style(
+        "", fg=fg, bg=bg, bold=bold, underline=ul, italic=italic, reset=False
+    )
+
+
 def error(message: str | Exception, exit: bool = True) -> None:
     click.secho(f"\n\nError: {message}", fg="red")
     if exit:
@@ -199,21 +273,247 @@ def find_dir_upwards(
     If stop_at is reached, return None.  Generally this is used to prevent
     scanning the home dir.
     """
-    current_path = start_path.resolve()
-
-    while current_path != current_path.parent:
-        if stop_at and current_path == Path(stop_at).expanduser():
+    # Plain strings and one stat per level, this runs on every prompt
+    is_type = stat.S_ISDIR if ftype == "dir" else stat.S_ISREG
+    # Normalize stop the same way so a trailing slash or symlink still matches
+    stop = os.path.realpath(os.path.expanduser(stop_at)) if stop_at else None
+    current_path = os.path.realpath(start_path)
+    parent = os.path.dirname(current_path)
+
+    while current_path != parent:
+        if current_path == stop:
             return None
-        potential_target = current_path / target_dir
-        if ftype == "dir" and potential_target.is_dir():
-            return potential_target
-        elif ftype == "file" and potential_target.is_file():
-            return potential_target
-        current_path = current_path.parent
+        potential_target = os.path.join(current_path, target_dir)
+        try:
+            if is_type(os.stat(potential_target).st_mode):
+                return Path(potential_target)
+        except OSError:
+            pass
+        current_path, parent = parent, os.path.dirname(parent)
 
     return None
 
 
+GIT_STATUS_TIMEOUT = 0.15  # seconds, $PROMPT_GIT_TIMEOUT overrides it
+# Only the dirty state is needed, the branch name is read from HEAD
+GIT_STATUS_COMMAND = ["git", "status", "--porcelain=v1", "--untracked-files=no"]
+
+
+def scan_parent_dirs(start: Path, home: str) -> dict[str, Path | None]:
+    """Walk up the directory tree once, collecting .git, .bare, and .ddev markers.
+
+    The walk stops before the home dir.
+    """
+    results: dict[str, Path | None] = {".git": None, ".bare": None, ".ddev": None}
+    targets_remaining = set(results.keys())
+    current = start.resolve()
+    home_path = Path(home).resolve() if home else None
+
+    while current != current.parent and targets_remaining:
+        if home_path and current == home_path:
+            break
+        for target in list(targets_remaining):
+            candidate = current / target
+            if target == ".git":
+                # .git can be a dir (normal repo) or file (worktree)
+                if candidate.is_dir() or candidate.is_file():
+                    results[target] = candidate
+                    targets_remaining.discard(target)
+            else:
+                if candidate.exists():
+                    results[target] = candidate
+                    targets_remaining.discard(target)
+        current = current.parent
+
+    return results
+
+
+@functools.lru_cache(maxsize=4)
+def resolve_git_dir(git_path: Path) -> Path:
+    """Return the git dir for a .git marker.
+
+    For worktrees and submodules .git is a file pointing at the real git
+    dir.  Raises OSError if that file can't be read.
+    """
+    if git_path.is_file():
+        # worktree: "gitdir: /path/to/.bare/worktrees/name"
+        gitdir = git_path.read_text().partition("gitdir:")[2].strip()
+        return git_path.parent / gitdir
+    return git_path
+
+
+def hyperlinks_enabled(env: Mapping[str, str]) -> bool:
+    """Return True if the prompt should contain terminal hyperlinks.
+
+    Links are only worth sending when a terminal will show the prompt.
+    stdout is a pipe under $(prompt ps1), so stderr is checked too.
+    """
+    return env.get("TERM") != "dumb" and (sys.stdout.isatty() or sys.stderr.isatty())
+
+
+def read_git_branch(git_path: Path) -> str | None:
+    """Return the branch checked out in a repo by reading HEAD directly.
+
+    git_path is the .git dir, or the .git file of a worktree.  A detached
+    HEAD gives the short sha.  Returns None if HEAD can't be read or the
+    branch has no commits yet.
+    """
+    try:
+        git_dir = resolve_git_dir(git_path)
+        head = (git_dir / "HEAD").read_text().strip()
+    except OSError:
+        return None
+    if not head.startswith("ref: "):
+        return head[:7]
+
+    ref = head[5:]
+    try:
+        common_dir = git_dir / (git_dir / "commondir").read_text().strip()
+    except OSError:
+        common_dir = git_dir
+    if (common_dir / ref).is_file():
+        return ref.removeprefix("refs/heads/")
+    try:
+        packed_refs = (common_dir / "packed-refs").read_text()
+    except OSError:
+        return None
+    if f" {ref}\n" in packed_refs:
+        return ref.removeprefix("refs/heads/")
+    return None
+
+
+def terminal_columns(default: int = 80) -> int:
+    """Return the terminal width without shelling out to stty.
+
+    When run as $(prompt ps1) stdout is a pipe, so stderr and stdin are
+    tried as well, then /dev/tty which is what stty would have read.
+    """
+    for fd in (1, 2, 0):
+        try:
+            return os.get_terminal_size(fd).columns
+        except OSError:
+            pass
+    try:
+        tty = os.open("/dev/tty", os.O_RDONLY)
+    except OSError:
+        return default
+    try:
+        return os.get_terminal_size(tty).columns
+    except OSError:
+        return default
+    finally:
+        os.close(tty)
+
+
+def cache_dir() -> str:
+    """Return the dir used for caching between prompt renders."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "prompt-teleport")
+
+
+def load_projects(project_conf: str | Path) -> list[tuple[str, str, str]]:
+    """Return the (name, dir, bg) rows from the projects file.
+
+    Project dirs are expanded and resolved so they can be compared with
+    the resolved cwd.
+
+    Raises FileNotFoundError if the projects file doesn't exist.
+    """
+    # Plain tab separated rows, the same format projects.py writes
+    rows = []
+    with open(project_conf) as conf:
+        for line in conf:
+            row = line.rstrip("\r\n").split("\t", 3)
+            if len(row) < 3 or row[0].startswith("#"):
+                continue
+            project_dir = os.path.realpath(os.path.expanduser(row[1]))
+            rows.append((row[0], project_dir, row[2]))
+    return rows
+
+
+DDEV_CACHE_TTL = 30  # seconds
+
+
+def ddev_status(ddev_dir: Path) -> str | None:
+    """Return the status of the ddev project that owns ddev_dir.
+
+    `ddev describe` is too slow to run for every prompt, so its output is
+    cached per project.  A stale cache is still used, and is refreshed in
+    the background for the next prompt.  ddev is only run in the
+    foreground when there is no cache yet.  Returns None if ddev's output
+    can't be read.
+    """
+    import json
+    import subprocess
+    import time
+    import zlib
+
+    project_dir = os.path.dirname(ddev_dir)
+    cache_file = os.path.join(
+        cache_dir(), "ddev", f"{zlib.crc32(str(ddev_dir).encode()):08x}.json"
+    )
+    try:
+        cache_mtime = os.stat(cache_file).st_mtime
+        with open(cache_file) as f:
+            status: str = json.load(f)["raw"]["status"]
+    except (OSError, ValueError, LookupError, TypeError):
+        pass
+    else:
+        try:
+            config_mtime = os.stat(
+                os.path.join(ddev_dir, ".ddev-docker-compose-full.yaml")
+            ).st_mtime
+        except OSError:
+            config_mtime = 0.0
+        now = time.time()
+        if config_mtime > cache_mtime or now - cache_mtime > DDEV_CACHE_TTL:
+            # Touch the cache first so the prompts that follow don't also
+            # start a refresh while this one is running.
+            try:
+                os.utime(cache_file, (now, now))
+            except OSError:
+                return status  # read-only cache, the refresh couldn't be saved
+            tmp_file = f"{cache_file}.{os.getpid()}"
+            subprocess.Popen(
+                [
+                    "sh",
+                    "-c",
+                    'ddev describe --json-output > "$1" && mv "$1" "$2" || rm -f "$1"',
+                    "sh",
+                    tmp_file,
+                    cache_file,
+                ],
+                cwd=project_dir,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        return status
+
+    output = subprocess.run(
+        ["ddev", "describe", "--json-output"],
+        cwd=project_dir,
+        universal_newlines=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        status = json.loads(output.stdout)["raw"]["status"]
+    except (json.JSONDecodeError, LookupError, TypeError) as e:
+        error(e, exit=False)
+        return None
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            f.write(output.stdout)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # the cache is only an optimization
+    return status
+
+
 def clamp(val: int | float, minimum: int = 0, maximum: int = 255) -> int | float:
     """Clamp a value between a minimum and maximum value"""
     if val < minimum:
@@ -223,6 +523,7 @@ def clamp(val: int | float, minimum: int = 0, maximum: int = 255) -> int | float
     return val
 
 
+@functools.lru_cache(maxsize=128)
 def hex_to_rgb(hex_string: str) -> tuple[int, int, int]:
     """Convert a hex string to an RGB tuple
 
@@ -237,13 +538,8 @@ def hex_to_rgb(hex_string: str) -> tuple[int, int, int]:
             "hex string must have 6 characters starting with an optional # symbol"
         )
 
-    rgb: list[int] = []
-    for i in range(0, 6, 2):
-        hex_part = hex_string[i : i + 2]
-        hex_int = int(hex_part, 16)
-        rgb.append(hex_int)
-
-    return (rgb[0], rgb[1], rgb[2])
+    r, g, b = bytes.fromhex(hex_string)
+    return (r, g, b)
 
 
 def rgb_to_hex(rgb: tuple[int, int, int]) -> str:
@@ -252,6 +548,7 @@ def rgb_to_hex(rgb: tuple[int, int, int]) -> str:
     return f"#{r:02x}{g:02x}{b:02x}"
 
 
+@functools.lru_cache(maxsize=128)
 def colorscale(hexstr: str, scalefactor: float) -> str:
     """
     Scales a hex string by ``scalefactor``. Returns scaled hex string.
@@ -272,13 +569,14 @@ def colorscale(hexstr: str, scalefactor: float) -> str:
     if scalefactor < 0 or len(hexstr) != 6:
         return hexstr
 
-    r, g, b = int(hexstr[:2], 16), int(hexstr[2:4], 16), int(hexstr[4:], 16)
+    r, g, b = bytes.fromhex(hexstr)
 
-    r = int(clamp(r * scalefactor))
-    g = int(clamp(g * scalefactor))
-    b = int(clamp(b * scalefactor))
+    # scalefactor is never negative here, so only the top needs clamping
+    r = min(255, int(r * scalefactor))
+    g = min(255, int(g * scalefactor))
+    b = min(255, int(b * scalefactor))
 
-    return "#%02x%02x%02x" % (r, g, b)
+    return "#%06x" % ((r << 16) | (g << 8) | b)
 
 
 def adjust_hue(rgb: Tuple[int, int, int], hue_shift: float) -> Tuple[int, int, int]:
@@ -288,11 +586,9 @@ def adjust_hue(rgb: Tuple[int, int, int], hue_shift: float) -> Tuple[int, int, i
     :param hue_shift: Amount to shift hue (0.0-1.0, where 1.0 is a full rotation).
     :return: New RGB tuple with adjusted hue.
     """
+    r, g, b = rgb
     # Normalize RGB to 0-1
-    r, g, b = [x / 255.0 for x in rgb]
-    # hue_shift = hue_shift * 2
-    # print(rgb, r, g, b, hue_shift)
-    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    h, s, v = colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
     h = (h + hue_shift) % 1.0
     r2, g2, b2 = colorsys.hsv_to_rgb(h, s, v)
     return (int(r2 * 255), int(g2 * 255), int(b2 * 255))
@@ -301,8 +597,10 @@ def adjust_hue(rgb: Tuple[int, int, int], hue_shift: float) -> Tuple[int, int, i
 def hash_to_float(s: str) -> float:
     """Convert a hashed string to a floating-point number between 0 and 1.
 
-    Computes a floating-point number from a given string by generating an MD5 hash
-    and converting it to a float in the range 0 -> 1.
+    Computes a floating-point number from a given string by generating a CRC32
+    checksum and converting it to a float in the range 0 -> 1.  This is only
+    used to pick colors, so it doesn't need a cryptographic hash, but it does
+    need to be stable between runs, which rules out hash().
 
     Parameters:
     s (str): The input string to hash and convert.
@@ -310,9 +608,9 @@ def hash_to_float(s: str) -> float:
     Returns:
     float: The resulting floating-point number in the range 0..1.
     """
-    h = hashlib.md5(s.encode()).hexdigest()
-    i = int(h, 16)
-    return i / float(2**128 - 1)
+    import zlib
+
+    return zlib.crc32(s.encode()) / 0xFFFFFFFF
 
 
 def urlize(text: str, url: str) -> str:
@@ -326,7 +624,7 @@ def urlize(text: str, url: str) -> str:
     '\e]8;;file://{}{}\a{}\\e]8;;\a'.format(socket.gethostname(), url, text)
     """
     # return r'\e]8;;file://{}\a{}\e]8;;\a'.format(url, text)
-    return "\x1b]8;;{}\a{}\x1b]8;;\a".format(url, text)
+    return f"\x1b]8;;{url}\a{text}\x1b]8;;\a"
 
 
 def snip(string: str, length: int, sep: str, position: float = 0.5) -> tuple[str, str]:
@@ -337,46 +635,42 @@ def snip(string: str, length: int, sep: str, position: float = 0.5) -> tuple[str
     :param sep: The separator to use between the two parts of the string.
     :param position: The position of the separator.
     """
-    if len(string) <= length:
+    string_length = len(string)
+    if string_length <= length:
         return (string, "")
 
     sep_length = len(sep)
     sep_position = int(length * position)
-    sep_position = (
-        sep_position - sep_length
-        if sep_position + sep_length > length
-        else sep_position
-    )
+    if sep_position + sep_length > length:
+        sep_position = max(0, sep_position - sep_length)
+    # what is left after the start and the separator comes from the end
+    end_length = length - sep_position - sep_length
     start = string[:sep_position]
-    end = string[sep_position + sep_length - length :]
+    end = string[string_length - end_length :] if end_length > 0 else ""
     # snipped = start + sep + end
     return start, end
 
 
+# Segment -> name of the Chunks method that renders it.  Names rather than
+# functions so the methods can still be overridden on a class or instance.
+_CHUNK_METHODS = {segment: f"_chunk_{segment.name.lower()}" for segment in Segment}
+
+
 class Chunks:
     HOME: str = os.environ.get("HOME", "")
     IS_SSH: str = os.environ.get("SSH_CLIENT", "")
-    HOSTNAME: str = socket.gethostname()
+    HOSTNAME: str = ""  # looked up by _chunk_user
 
-    def __init__(self, columns: str | None = None) -> None:
+    def __init__(self, columns: int | str | None = None) -> None:
+        # One copy of the environment for the whole render
+        self._env = os.environ.copy()
         ssh_location = "Remote" if self.IS_SSH else "Local"
         self.theme = self._get_theme(ssh_location)
         self.segment_lengths: list[int] = []
         # Accept columns parameter for testing, fall back to COLUMNS env var, then detect
-        if columns:
-            self.columns = columns
-        else:
-            self.columns = os.environ.get("COLUMNS") or ""
-            if not self.columns:
-                try:
-                    self.columns = str(os.get_terminal_size().columns)
-                except OSError:
-                    # No tty (e.g. running in subshell via $(prompt ps1)).
-                    # stty reads /dev/tty directly so it works from subshells.
-                    try:
-                        _, self.columns = os.popen("stty size", "r").read().split()
-                    except ValueError:
-                        self.columns = "80"
+        self.columns = int(columns or self._env.get("COLUMNS") or 0)
+        if not self.columns:
+            self.columns = terminal_columns()
         try:
             self.snip_char = self.theme["snip_char"]["char"]
         except KeyError:
@@ -386,49 +680,35 @@ class Chunks:
         except KeyError:
             self.filler_char = Ellipses.hr
 
+        # getcwd() once, every chunk and the tab titles use these
+        self.cwd = os.getcwd()
+        self.cwd_path = Path(self.cwd)
+        self.hyperlinks = hyperlinks_enabled(self._env)
         self._dir_markers = self._scan_parent_dirs()
         self._git_proc: subprocess.Popen[str] | None = None
+        self._git_branch: str | None = None
 
     def _scan_parent_dirs(self) -> dict[str, Path | None]:
         """Walk up the directory tree once, collecting .git, .bare, and .ddev markers."""
-        results: dict[str, Path | None] = {".git": None, ".bare": None, ".ddev": None}
-        targets_remaining = set(results.keys())
-        current = Path.cwd().resolve()
-        home = Path(self.HOME).resolve() if self.HOME else None
-
-        while current != current.parent and targets_remaining:
-            if home and current == home:
-                break
-            for target in list(targets_remaining):
-                candidate = current / target
-                if target == ".git":
-                    # .git can be a dir (normal repo) or file (worktree)
-                    if candidate.is_dir() or candidate.is_file():
-                        results[target] = candidate
-                        targets_remaining.discard(target)
-                else:
-                    if candidate.exists():
-                        results[target] = candidate
-                        targets_remaining.discard(target)
-            current = current.parent
-
-        return results
+        return scan_parent_dirs(self.cwd_path, self.HOME)
 
     def launch_git_status(self) -> None:
         """Pre-launch git status as a non-blocking subprocess.
 
         Call this early so git runs in the background while other chunks are built.
         """
-        if self._dir_markers.get(".git") is not None:
+        git_path = self._dir_markers.get(".git")
+        if git_path is not None:
+            import subprocess
+
+            # No need for git when there are no commits to compare against
+            self._git_branch = read_git_branch(git_path)
+            if self._git_branch is None:
+                return
             try:
                 self._git_proc = subprocess.Popen(
-                    [
-                        "git",
-                        "status",
-                        "--porcelain=v1",
-                        "--branch",
-                        "--untracked-files=no",
-                    ],
+                    GIT_STATUS_COMMAND,
+                    env=self._git_env(),
                     text=True,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.DEVNULL,
@@ -436,6 +716,11 @@ class Chunks:
             except FileNotFoundError:
                 self._git_proc = None
 
+    def _git_env(self) -> dict[str, str]:
+        # Don't let the prompt's git status take index.lock or rewrite the
+        # index, that can get in the way of git commands the user runs.
+        return {**self._env, "GIT_OPTIONAL_LOCKS": "0"}
+
     def _get_theme(self, theme_name: str) -> dict[Any, Any]:
         theme = {}
         try:
@@ -454,9 +739,8 @@ class Chunks:
         get the number of elements in self.NON_PATH_LENGTH and the sum of the
         elements to account for a single space between elements.
         """
-        # rows, columns = os.popen("stty size", "r").read().split()
         non_path_length = len(self.segment_lengths) + sum(self.segment_lengths)
-        max_len = (int(self.columns)) - non_path_length - len(extra)
+        max_len = self.columns - non_path_length - len(extra)
         return max_len
 
     def apply_chunk_theme(
@@ -539,16 +823,20 @@ class Chunks:
                 template = "{}"
             # get the length of the string before any styles are applied
             self._add_length(template.format("".join(chunks)))
+            fg = theme.get("fg", "")
+            bold = theme.get("bold", False)
+            italic = theme.get("italic", False)
+            ul = theme.get("underline", False)
             parts = []
             # for the path chunk since it might be split in two
             for chunk in chunks:
                 rendered_chunk = self._style_chunk(
                     chunk,
-                    fg=theme.get("fg", ""),
+                    fg=fg,
                     bg=bg,
-                    bold=theme.get("bold", False),
-                    italic=theme.get("italic", False),
-                    ul=theme.get("underline", False),
+                    bold=bold,
+                    italic=italic,
+                    ul=ul,
                     no_brackets=no_brackets,
                     hide_brackets=hide_brackets,
                 )
@@ -562,7 +850,7 @@ class Chunks:
                     bg=snip_theme.get(bg, ""),
                     no_brackets=True,
                 )
-                rendered_chunks = "".join([parts[0], fancy_char, parts[1]])
+                rendered_chunks = f"{parts[0]}{fancy_char}{parts[1]}"
             else:
                 rendered_chunks = "".join(parts)
 
@@ -581,7 +869,7 @@ class Chunks:
                     no_brackets=no_brackets,
                     hide_brackets=hide_brackets,
                 )
-                rendered_chunks = "".join([rendered_chunks, extra_chunk])
+                rendered_chunks = f"{rendered_chunks}{extra_chunk}"
 
         return rendered_chunks
 
@@ -601,15 +889,10 @@ class Chunks:
             bracket_fg = bg
         formated_chunk: str = ""
         try:
-            bracket_start = click.style(
-                "[", fg=bracket_fg, bg=bg, bold=bold, underline=ul, italic=italic
-            )
-            bracket_end = click.style(
-                "]", fg=bracket_fg, bg=bg, bold=bold, underline=ul, italic=italic
-            )
-            formated_chunk = click.style(
-                chunk, fg=fg, bg=bg, bold=bold, underline=ul, italic=italic
-            )
+            bracket_codes = style_codes(bracket_fg, bg, bold, italic, ul)
+            bracket_start = f"{bracket_codes}[{RESET}"
+            bracket_end = f"{bracket_codes}]{RESET}"
+            formated_chunk = f"{style_codes(fg, bg, bold, italic, ul)}{chunk}{RESET}"
         except TypeError as e:
             bracket_start = "["
             bracket_end = "]"
@@ -624,37 +907,32 @@ class Chunks:
         if no_brackets:
             complete = formated_chunk
         else:
-            complete = "".join([bracket_start, formated_chunk, bracket_end])
+            complete = f"{bracket_start}{formated_chunk}{bracket_end}"
 
         return complete
 
     # @staticmethod
     def get_project_info(self) -> tuple[str, str, str]:
         """Get the project name and color from ~/.prompt-projects"""
-        # TODO: optimize this method
         project_conf = Path("~/.prompt-projects").expanduser()
-        cur = Path(os.path.curdir).absolute()
+        cur = self.cwd_path
+        # Both sides are resolved absolute paths, so a prefix test is enough.
+        # join(dir, "") adds the trailing separator, except to "/".
+        cwd = os.path.join(self.cwd, "")
         project_name = ""  # cur.name
         project_bg = "blue"
         project_fg = "white"
         try:
-            with open(project_conf) as conf:
-                reader = csv.reader(conf, delimiter="\t", quotechar='"')
-                for row in reader:
-                    if not row:
-                        continue
-                    if row[0].startswith("#"):
-                        continue
-                    if cur.is_relative_to(row[1]):
-                        project_name = row[0]
-                        # project_dir = row[1]
-                        project_bg = row[2]
-                        project_fg = colorscale(project_bg, 3)
-                        break
+            for name, project_dir, bg in load_projects(project_conf):
+                if cwd.startswith(os.path.join(project_dir, "")):
+                    project_name = name
+                    project_bg = bg
+                    project_fg = colorscale(project_bg, 3)
+                    break
         except FileNotFoundError:
             error(f"No projects file found: {project_conf}", exit=False)
 
-        flox_env_name = os.getenv("FLOX_ENV_DESCRIPTION", "")
+        flox_env_name = self._env.get("FLOX_ENV_DESCRIPTION", "")
         if not flox_env_name or flox_env_name == "default":
             flox_env_name = ""
         else:
@@ -662,7 +940,7 @@ class Chunks:
                 Ellipses.xlarge_dot  # Ellipses.green_dot
             )  # Ellipses.large_dot # f'[{flox_env_name}]'
 
-        if os.environ.get("KITTY_PID"):
+        if self._env.get("KITTY_PID"):
             set_kitty_tabs(
                 project_name,
                 project_bg,
@@ -670,8 +948,9 @@ class Chunks:
                 cur,
                 flox_env_name,
                 self._dir_markers,
+                self._env,
             )
-        elif os.environ.get("ITERM_SESSION_ID"):
+        elif self._env.get("ITERM_SESSION_ID"):
             set_iterm2_tabs(
                 project_name,
                 project_bg,
@@ -684,7 +963,7 @@ class Chunks:
         return (project_name, project_bg, project_fg)
 
     def get_chunk(self, segment: Segment) -> Any:
-        method_name = f"_chunk_{segment.name.lower()}"
+        method_name = _CHUNK_METHODS.get(segment, "")
         method = getattr(self, method_name, None)
         if method is None:
             error(f"Invalid Chunk: {segment}")
@@ -699,19 +978,22 @@ class Chunks:
     def _chunk_path(self) -> str:
         """Return the current path truncated to fit the leftover terminal width"""
         # find -type d | awk '{ print length, $0 }' | sort -n -s | cut -d" " -f2- | tail -n 10
-        path = os.path.abspath(os.path.curdir)
-        link_path = "file://{}".format(path)
-        path = path.replace(self.HOME, "~")
-        path = path.replace(" ", r"\ ")
+        path = self.cwd
+        link_path = f"file://{path}"
+        home = self.HOME
+        if home and (path == home or path.startswith(home + "/")):
+            path = "~" + path[len(home) :]
+        if " " in path:
+            path = path.replace(" ", r"\ ")
 
         # ellipses = self.theme.get("snip_char", Ellipses.large_square)
         max_len = self._get_length(self.snip_char)
 
         if max_len > len(path):
             if len(path) != 1:
-                pretty_path = urlize(
-                    self.apply_chunk_theme(Segment.PATH, (path,)), link_path
-                )
+                pretty_path = self.apply_chunk_theme(Segment.PATH, (path,))
+                if self.hyperlinks:
+                    pretty_path = urlize(pretty_path, link_path)
             else:
                 self._add_length(path)
                 pretty_path = path  # don't urlize a single character path, ie: ~ or / (it looks bad)
@@ -720,10 +1002,11 @@ class Chunks:
             # Record the actual snipped width, not the full path width
             self._add_length(parts[0] + self.snip_char + parts[1])
 
-            pretty_path = urlize(
-                self.apply_chunk_theme(Segment.PATH, parts, split_char=self.snip_char),
-                link_path,
+            pretty_path = self.apply_chunk_theme(
+                Segment.PATH, parts, split_char=self.snip_char
             )
+            if self.hyperlinks:
+                pretty_path = urlize(pretty_path, link_path)
             # pretty_path = urlize(self._theme(Segment.PATH, snip_path), link_path)
 
         return pretty_path
@@ -733,59 +1016,78 @@ class Chunks:
         # the length of path since it is expanded after the $PS1 is echoed.
         # >>> return r'\u@\H'
         # Use this instead:
-        cur_user = os.environ["USER"]
+        cur_user = self._env["USER"]
+        hostname = self.HOSTNAME or get_hostname()
         return self.apply_chunk_theme(
-            Segment.USER, ("{}@{}".format(cur_user, self.HOSTNAME),)
+            Segment.USER, ("{}@{}".format(cur_user, hostname),)
         )
 
     def _chunk_sink(self) -> str:
         return self.apply_chunk_theme(Segment.SINK, ("",), no_brackets=False)
 
     def _chunk_time(self) -> str:
+        import datetime
+
         now = datetime.datetime.now()
         formated = now.strftime("%H:%M")
         return self.apply_chunk_theme(Segment.TIME, (formated,))
 
     def _chunk_branch(self) -> str:
-        if self._dir_markers.get(".git") is None:
+        git_path = self._dir_markers.get(".git")
+        if git_path is None:
             return ""
 
+        # The branch name comes from HEAD, git is only asked for the dirty
+        # state (without --branch, so it skips the ahead/behind walk).
         # Use pre-launched git process if available, otherwise run synchronously
+        import subprocess
+
+        try:
+            timeout = float(self._env.get("PROMPT_GIT_TIMEOUT") or GIT_STATUS_TIMEOUT)
+        except ValueError:
+            timeout = GIT_STATUS_TIMEOUT  # a bad setting mustn't break the prompt
+        timeout = max(0.0, timeout)
+        stdout: str | None = None
         if self._git_proc is not None:
-            stdout, _ = self._git_proc.communicate()
-            self._git_proc = None
-            if not stdout:
-                return ""
-            if stdout == "## No commits yet on main\n":
-                return ""
+            branch = self._git_branch
+            proc, self._git_proc = self._git_proc, None
+            try:
+                stdout, _ = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+            else:
+                if proc.returncode:
+                    return ""
         else:
+            branch = read_git_branch(git_path)
+            if branch is None:
+                return ""
             try:
                 git_status = subprocess.run(
-                    [
-                        "git",
-                        "status",
-                        "--porcelain=v1",
-                        "--branch",
-                        "--untracked-files=no",
-                    ],
+                    GIT_STATUS_COMMAND,
+                    env=self._git_env(),
                     universal_newlines=True,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.DEVNULL,
+                    timeout=timeout,
                 )
             except FileNotFoundError:
                 return ""
-            if not git_status:
-                return ""
-            if not git_status.stdout:
-                return ""
-            if git_status.stdout == "## No commits yet on main\n":
-                return ""
-            stdout = git_status.stdout
-        lines = stdout.splitlines()
-        # parse lines[0]: '## main...origin/main'
-        branch = lines[0][3:].split("...")[0]
+            except subprocess.TimeoutExpired:
+                pass
+            else:
+                if git_status.returncode:
+                    return ""
+                stdout = git_status.stdout
+        if not branch:
+            return ""
 
-        clean = len(lines[1:]) == 0
+        # git took too long: show the branch without the clean/dirty dot
+        if stdout is None:
+            return self.apply_chunk_theme(Segment.BRANCH, (branch,))
+
+        clean = not stdout
         color = "green" if clean else "red"
         extra = (Ellipses.large_dot, {"fg": color})
         branch = self.apply_chunk_theme(Segment.BRANCH, (branch,), extra=extra)
@@ -814,8 +1116,8 @@ class Chunks:
         return ""
 
     def _chunk_venv(self) -> str:
-        venv = os.getenv("VIRTUAL_ENV", "")
-        poetry = os.getenv("POETRY_ACTIVE", "")
+        venv = self._env.get("VIRTUAL_ENV", "")
+        poetry = self._env.get("POETRY_ACTIVE", "")
         chunk = ""
         if venv and not poetry:
             venv = os.path.basename(venv)
@@ -824,19 +1126,19 @@ class Chunks:
         return chunk
 
     def _chunk_poetry(self) -> str:
-        poetry = os.getenv("POETRY_ACTIVE", "")
+        poetry = self._env.get("POETRY_ACTIVE", "")
         if poetry:
             poetry = self.apply_chunk_theme(Segment.POETRY, ("Poetry",))
         return poetry
 
     def _chunk_nix(self) -> str:
-        nix = os.getenv("NIX_STORE", "")
+        nix = self._env.get("NIX_STORE", "")
         if nix:
             nix = self.apply_chunk_theme(Segment.NIX, ("Nix",))
         return nix
 
     def _chunk_flox(self) -> str:
-        flox_env_name = os.getenv("FLOX_ENV_DESCRIPTION", "")
+        flox_env_name = self._env.get("FLOX_ENV_DESCRIPTION", "")
 
         if flox_env_name != "default":
             is_active_env = True
@@ -846,6 +1148,9 @@ class Chunks:
             flox = self.apply_chunk_theme(Segment.FLOX_DEFAULT, (flox_name,))
             return flox
 
+        import json
+        import subprocess
+
         try:
             output = subprocess.run(
                 ["flox", "envs", "--json"],
@@ -865,7 +1170,7 @@ class Chunks:
         return ""
 
     def _chunk_flox_default(self) -> str:
-        flox_name = os.getenv("FLOX_ENV_DESCRIPTION", "")
+        flox_name = self._env.get("FLOX_ENV_DESCRIPTION", "")
         flox = ""
         if flox_name and flox_name == "default":
             flox_name = "fx"
@@ -885,7 +1190,7 @@ class Chunks:
           no flox
 
         """
-        flox_name = os.getenv("FLOX_ENV_DESCRIPTION", "")
+        flox_name = self._env.get("FLOX_ENV_DESCRIPTION", "")
         flox = ""
         if flox_name:
             if flox_name != "default":
@@ -894,33 +1199,25 @@ class Chunks:
         return flox
 
     def _chunk_ssh(self) -> str:
-        ssh_envoment = os.getenv("SSH_CLIENT", "")
+        ssh_envoment = self._env.get("SSH_CLIENT", "")
         if ssh_envoment:
             ssh_envoment = self.apply_chunk_theme(Segment.SSH, ("ssh",))
         return ssh_envoment
 
     def _chunk_pipenv(self) -> str:
-        pipenv = os.getenv("PIPENV_ACTIVE", "")
+        pipenv = self._env.get("PIPENV_ACTIVE", "")
         if pipenv:
             pipenv = self.apply_chunk_theme(Segment.PIPENV, (pipenv,))
         return pipenv
 
     def _chunk_ddev(self) -> str:
         ddev = ""
-        if self._dir_markers.get(".ddev"):
-            output = subprocess.run(
-                ["ddev", "describe", "--json-output"],
-                universal_newlines=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-            )
-            try:
-                info = json.loads(output.stdout)["raw"]
-            except json.JSONDecodeError as e:
-                error(e, exit=False)
+        ddev_dir = self._dir_markers.get(".ddev")
+        if ddev_dir:
+            status = ddev_status(ddev_dir)
+            if status is None:
                 return "Error"
-            clean = True
-            color = "green" if info["status"] == "running" else "red"
+            color = "green" if status == "running" else "red"
             extra = (Ellipses.large_dot, {"fg": color})
             ddev = self.apply_chunk_theme(Segment.DDEV, ("DDev",), extra=extra)
         return ddev
@@ -953,6 +1250,8 @@ def adjust_rgb(
     # using the dir as a seed, convert to a float
     distance = hash_to_float(str(dir))
     seed = int(str(distance).replace("0.", ""))
+    import random
+
     rnd = random.Random(seed)
     amount = rnd.random()
     # print(seed, "-", amount, "-", amount)
@@ -962,6 +1261,16 @@ def adjust_rgb(
     return adjusted
 
 
+def iterm2_tab_color(rgb: tuple[int, int, int]) -> str:
+    """Return the escape codes that set the iTerm2 tab color"""
+    r, g, b = rgb
+    return (
+        f"\033]6;1;bg;red;brightness;{r}\a"
+        f"\033]6;1;bg;green;brightness;{g}\a"
+        f"\033]6;1;bg;blue;brightness;{b}\a"
+    )
+
+
 def set_iterm2_tabs(
     project_name: str,
     project_bg: str,
@@ -1000,29 +1309,25 @@ def set_iterm2_tabs(
         is_worktree_root = bare_marker is not None
     else:
         worktree_branch_root = find_dir_upwards(current, ".git", ftype="file")
-        worktree_root = (Path() / ".bare").absolute()
+        worktree_root = current / ".bare"
         is_worktree_root = worktree_root.exists()
 
-    rgb_template = "\033]6;1;bg;{color};brightness;{value}\a"
-
     is_regular_dir = not project_name
     is_worktree_subdir = worktree_branch_root and not is_worktree_root
     is_regular_project = project_name and not is_worktree_subdir
 
     if is_regular_dir:
         template = r"\e]1;{}\n{}\a"  # a second row is necessary since the previous second row is not cleared automatically
-        project_name = os.path.basename(os.getcwd())
+        project_name = current.name
         project_name = project_name + flox_env
-        click.echo(template.format(project_name, ""), nl=False)
-        click.echo("\033]6;1;bg;*;default\a", nl=False)  # reset tab to default
+        reset = "\033]6;1;bg;*;default\a"  # reset tab to default
+        click.echo(template.format(project_name, "") + reset, nl=False)
 
     elif is_worktree_subdir:
         assert worktree_branch_root is not None
         template = r"\e]1;{}\n{}\a"  # add a second row for the dir basename
         project_name = project_name + flox_env
-        click.echo(
-            template.format(project_name, worktree_branch_root.parent.name), nl=False
-        )
+        title = template.format(project_name, worktree_branch_root.parent.name)
         rgb = hex_to_rgb(project_bg)
         # Trying to keep the tabs similar color to the project color in a worktree
         # context is not really useful.  So, for now use 0 for squeeze amount and
@@ -1030,17 +1335,14 @@ def set_iterm2_tabs(
         # 100% random.
         squeeze_amount = 0  # 1: no difference, 0: most different
         rgb = adjust_rgb(rgb, worktree_branch_root.absolute(), squeeze_amount)
-        for color, value in zip(("red", "green", "blue"), rgb):
-            click.echo(rgb_template.format(color=color, value=value), nl=False)
+        click.echo(title + iterm2_tab_color(rgb), nl=False)
 
     elif is_regular_project:
         # print(hex_to_rgb(project_bg))
         template = r"\e]1;{}\n{}\a"  # a second row is necessary since the previous second row is not cleared automatically
         project_name = project_name + flox_env
-        click.echo(template.format(project_name, ""), nl=False)
         rgb = hex_to_rgb(project_bg)
-        for color, value in zip(("red", "green", "blue"), rgb):
-            click.echo(rgb_template.format(color=color, value=value), nl=False)
+        click.echo(template.format(project_name, "") + iterm2_tab_color(rgb), nl=False)
 
     else:
         click.echo("This should never happen.")
@@ -1053,6 +1355,7 @@ def set_kitty_tabs(
     current: Path,
     flox_env: str,
     dir_markers: dict[str, Path | None] | None = None,
+    env: Mapping[str, str] | None = None,
 ) -> None:
     """Set the kitty terminal tab colors and title"""
     is_worktree_subdir = False
@@ -1103,7 +1406,7 @@ def set_kitty_tabs(
         }
     else:  # is_regular_dir:
         base_color = "#ffffff"
-        tab_title = "/".join(Path().absolute().parts[-2:]) + flox_env
+        tab_title = "/".join(current.parts[-2:]) + flox_env
         colors = {
             "active_fg": base_color,
             "active_bg": colorscale(base_color, 0.5),
@@ -1111,20 +1414,37 @@ def set_kitty_tabs(
             "inactive_bg": colorscale(base_color, 0.15),
         }
     all_colors = [f"{k}={v}" for k, v in colors.items()]
-    subprocess.call(
+    commands = (
         ["kitten", "@", "set-tab-title", tab_title],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
-    subprocess.call(
         ["kitten", "@", "set-tab-color"] + all_colors,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
     )
+    import subprocess
+
+    if env is None:
+        env = os.environ
+    # kitten @ takes a single remote control command per run, so the title
+    # and the colors can't share one invocation.
+    if env.get("KITTY_LISTEN_ON"):
+        # Each kitten gets its own socket connection so they can run at once
+        procs = [
+            subprocess.Popen(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            for command in commands
+        ]
+        for proc in procs:
+            proc.wait()
+    else:
+        # Over the tty the replies share one stream, so one at a time
+        for command in commands:
+            subprocess.call(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
 
 
-def ps1_prompt() -> str:
-    c = Chunks(columns=os.environ.get("COLUMNS"))
+def ps1_prompt(c: Chunks | None = None) -> str:
+    if c is None:
+        c = Chunks(columns=os.environ.get("COLUMNS"))
     # Pre-launch git status so it runs while other segments are built
     c.launch_git_status()
     right_segments = left_segments = last_segments = []
@@ -1154,11 +1474,81 @@ def ps1_prompt() -> str:
     except AttributeError as e:
         error(e, exit=True)
 
-    # the right segments need to be build first so their sizes are
-    # added to the Chunks.segment_lengths list before the filler
-    # segment calculates the leftover space.
-    right = " ".join(filter(None, [c.get_chunk(i) for i in right_segments if i]))
-    left = " ".join(filter(None, [c.get_chunk(i) for i in left_segments if i]))
-    last = " ".join(filter(None, [c.get_chunk(i) for i in last_segments if i]))
+    # Every segment is rendered once in a single pass, the filler goes
+    # last so all the other sizes are in Chunks.segment_lengths by the
+    # time it calculates the leftover space.
+    rendered: dict[Segment, str | None] = {}
+    for segment in [*right_segments, *left_segments, *last_segments]:
+        if segment != Segment.FILLER:
+            rendered[segment] = c.get_chunk(segment)
+    if Segment.FILLER in left_segments:
+        rendered[Segment.FILLER] = c.get_chunk(Segment.FILLER)
+
+    right, left, last = (
+        " ".join(chunk for chunk in map(rendered.get, group) if chunk)
+        for group in (right_segments, left_segments, last_segments)
+    )
     line = f"{left} {right}{last}"
     return line
+
+
+PS1_CACHE_TTL = 0.5  # seconds
+
+
+def cached_ps1_prompt() -> str:
+    """Return ps1_prompt(), reusing the last render if nothing has changed.
+
+    Hitting enter on an empty line redraws an identical prompt, so the
+    last render is kept in the cache dir and reused for PS1_CACHE_TTL
+    seconds.  It is keyed on the cwd, the environment, the terminal width,
+    whether hyperlinks are on and the mtimes of the repo's HEAD and index,
+    and anything else (the clock, unstaged edits) is allowed to be that
+    much out of date.
+    """
+    import time
+    import zlib
+
+    # The key is built from the same Chunks that renders a miss, so the
+    # cwd, width, links and the parent dir walk are only worked out once.
+    c = Chunks(columns=os.environ.get("COLUMNS"))
+    # Follow the .git file of worktrees and submodules, so they are keyed
+    # on their own HEAD and index too.
+    git_mtimes = []
+    git_path = c._dir_markers[".git"]
+    if git_path is not None:
+        try:
+            git_dir = resolve_git_dir(git_path)
+        except OSError:
+            git_dir = git_path
+        for name in ("HEAD", "index"):
+            try:
+                mtime = os.stat(os.path.join(git_dir, name)).st_mtime_ns
+                git_mtimes.append(str(mtime))
+            except OSError:
+                git_mtimes.append("")
+    environment = "\0".join(f"{k}={v}" for k, v in sorted(c._env.items()))
+    state = "\0".join(
+        [c.cwd, str(c.columns), str(c.hyperlinks), *git_mtimes, environment]
+    )
+    key = f"{zlib.crc32(state.encode()):08x}"
+
+    cache_file = os.path.join(cache_dir(), "ps1")
+    try:
+        with open(cache_file) as f:
+            fresh = time.time() - os.fstat(f.fileno()).st_mtime < PS1_CACHE_TTL
+            cached_key, cached_line = f.read().split("\n", 1)
+        if fresh and cached_key == key:
+            return cached_line
+    except (OSError, ValueError):
+        pass  # no usable cache, render the prompt
+
+    line = ps1_prompt(c)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            f.write(f"{key}\n{line}")
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # the cache is only an optimization
+    return line
@@ -1,24 +1,37 @@
 import click  # noqa: F401
-from typing import Any
+import os
+import sys
 from pathlib import Path
-import importlib.metadata
 from pprint import pprint as pp  # noqa: F401
 
-from .prompt import ps1_prompt
+from .prompt import ps1_prompt, cached_ps1_prompt
 from .prompt import themes as prompt_themes
-from .prompt import Segment
+from .prompt import Segment, RESET, style_codes
 
-from .projects import add as project_add, COLOR_TYPE
-from .projects import cd as project_cd
+# The project commands import .projects themselves, so `prompt ps1`,
+# which runs for every prompt, doesn't load it.
 
 # from .edit import test  # noqa: F401
 
-__version__ = importlib.metadata.version("prompt")
-
 
 def insert_time(line: str, time: float) -> str:
-    spline = line.splitlines()
-    return "\n".join([spline[0], f"{time:.6f} seconds", spline[1]])
+    end = line.find("\n")
+    if end < 0:
+        end = len(line)
+    return f"{line[:end]}\n{time:.6f} seconds{line[end:]}"
+
+
+class LazyColorType(click.ParamType):
+    """The project color type, with projects.py only imported to convert a value."""
+
+    name = "color"
+
+    def convert(
+        self, value: str, param: click.Parameter | None, ctx: click.Context | None
+    ) -> str:
+        from .projects import COLOR_TYPE
+
+        return COLOR_TYPE.convert(value, param, ctx)
 
 
 class NaturalOrderGroup(click.Group):
@@ -30,18 +43,18 @@ class NaturalOrderGroup(click.Group):
     https://github.com/pallets/click/issues/513
     """
 
-    def list_commands(self, ctx: Any) -> Any:
-        return self.commands.keys()
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return list(self.commands)
 
 
 CONTEXT_SETTINGS = {
     "help_option_names": ["-h", "--help"],
-    "token_normalize_func": lambda x: x.lower(),
+    "token_normalize_func": str.lower,
 }
 
 
 @click.group(context_settings=CONTEXT_SETTINGS, cls=NaturalOrderGroup)
-@click.version_option(version=__version__)
+@click.version_option(package_name="prompt", prog_name="prompt")
 def prompt() -> None:
     """Output a PS1 prompt for bash and teleport to projects.
 
@@ -63,9 +76,11 @@ def prompt() -> None:
 
 @prompt.command()
 def ps1() -> None:
-    """Output a PS1 prompt for bash."""
-    print()
-    if time_function := False:
+    """Output a PS1 prompt for bash.
+
+    Set PROMPT_TIME to show how long the prompt took to build.
+    """
+    if os.environ.get("PROMPT_TIME"):
         from timeit import default_timer as timer
 
         start = timer()
@@ -73,9 +88,9 @@ def ps1() -> None:
         end = timer()
         time = end - start
         line = insert_time(line, time)
-        print(line)
     else:
-        print(ps1_prompt())
+        line = cached_ps1_prompt()
+    sys.stdout.write(f"\n{line}\n")
 
 
 @prompt.command()
@@ -87,15 +102,14 @@ def themes() -> None:
         for k, v in prompt_themes[prompt_theme].items():
             if not isinstance(k, Segment):
                 continue
-            colored = click.style(
-                str(k).ljust(16),
-                fg=v.get("fg", ""),
-                bg=v.get("bg", ""),
-                bold=v.get("bold", False),
-                italic=v.get("italic", False),
-                underline=v.get("underline", False),
+            codes = style_codes(
+                v.get("fg", ""),
+                v.get("bg", ""),
+                v.get("bold", False),
+                v.get("italic", False),
+                v.get("underline", False),
             )
-            print(f"  {colored}", v)
+            print(f"  {codes}{str(k).ljust(16)}{RESET}", v)
 
 
 @prompt.group()
@@ -147,6 +161,8 @@ def project() -> None:
 @click.argument("project-name", type=str)
 def cd(project_name: str) -> None:
     """Teleport to a project."""
+    from .projects import cd as project_cd
+
     project_cd(project_name)
 
 
@@ -156,13 +172,51 @@ def cd(project_name: str) -> None:
     "project-root", type=click.Path(exists=True, file_okay=False, path_type=Path)
 )
 @click.option(
-    "--color", "-c", type=COLOR_TYPE, help="Color for the project name in the prompt."
+    "--color",
+    "-c",
+    type=LazyColorType(),
+    help="Color for the project name in the prompt.",
 )
 def add(name: str, project_root: Path, color: str) -> None:
     """Add a project to the list of projects."""
+    from .projects import add as project_add
+
     project_add(name, project_root, color)
 
 
+@prompt.command()
+@click.argument("shell", type=click.Choice(["bash", "zsh", "fish"]))
+def completion(shell: str) -> None:
+    """Output completion for cdd with the project names built in.
+
+    Unlike the _cdd function, which reads .prompt-projects on every TAB,
+    the names are only read when this runs, so load it from your shell's
+    startup file and restart the shell after adding a project.
+
+    \b
+    bash:  eval "$(prompt completion bash)"
+    zsh:   eval "$(prompt completion zsh)"
+    fish:  prompt completion fish | source
+    """
+    import shlex
+
+    from .projects import read_csv
+
+    # Each name is quoted on its own so names with spaces stay one candidate
+    words = [shlex.quote(name) for name in sorted(read_csv())]
+    if shell == "bash":
+        # compgen -W honors the quoting inside its word list
+        script = f"complete -W {shlex.quote(' '.join(words))} cdd"
+    elif shell == "zsh":
+        script = f"_cdd() {{ compadd -- {' '.join(words)}; }}\ncompdef _cdd cdd"
+    else:
+        # fish expands each -a argument, so one quoted entry per name
+        lines = ["complete -f -c cdd"]
+        lines += [f"complete -f -c cdd -a {shlex.quote(word)}" for word in words]
+        script = "\n".join(lines)
+    click.echo(script)
+
+
 # @project.command()
 # def edit() -> None:
 #     """Edit the project list."""
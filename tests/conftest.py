@@ -37,3 +37,9 @@ def mock_environment(monkeypatch):
             else:
                 monkeypatch.setenv(key, value)
     return set_env
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(monkeypatch, tmp_path):
+    """Keep prompt caches out of the real ~/.cache."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
@@ -34,22 +34,33 @@ class TestChunksInit:
                 assert chunks.theme is not None
 
     @pytest.mark.edge_case
-    def test_chunks_init_no_terminal_falls_back_to_stty(self):
-        """Test Chunks falls back to stty when os.get_terminal_size fails."""
-        with patch("os.get_terminal_size", side_effect=OSError("not a terminal")):
-            with patch("os.popen") as mock_popen:
-                mock_popen.return_value.read.return_value = "24 120"
-                chunks = Chunks()
-                assert chunks.columns == "120"
+    def test_chunks_init_no_terminal_falls_back_to_dev_tty(self, monkeypatch):
+        """Test Chunks reads /dev/tty when the std streams aren't terminals."""
+        monkeypatch.delenv("COLUMNS", raising=False)
+
+        def get_terminal_size(fd):
+            if fd == 99:
+                return os.terminal_size((120, 24))
+            raise OSError("not a terminal")
+
+        with patch("os.get_terminal_size", side_effect=get_terminal_size):
+            with patch("os.open", return_value=99) as mock_open:
+                with patch("os.close") as mock_close:
+                    with patch("os.popen") as mock_popen:
+                        chunks = Chunks()
+                        assert chunks.columns == 120
+                        mock_open.assert_called_once_with("/dev/tty", os.O_RDONLY)
+                        mock_close.assert_called_once_with(99)
+                        mock_popen.assert_not_called()
 
     @pytest.mark.edge_case
-    def test_chunks_init_no_terminal_falls_back_to_default(self):
-        """Test Chunks falls back to 80 when both detection methods fail."""
+    def test_chunks_init_no_terminal_falls_back_to_default(self, monkeypatch):
+        """Test Chunks falls back to 80 when there is no terminal at all."""
+        monkeypatch.delenv("COLUMNS", raising=False)
         with patch("os.get_terminal_size", side_effect=OSError("not a terminal")):
-            with patch("os.popen") as mock_popen:
-                mock_popen.return_value.read.return_value = ""
+            with patch("os.open", side_effect=OSError("no tty")):
                 chunks = Chunks()
-                assert chunks.columns == "80"
+                assert chunks.columns == 80
 
     @pytest.mark.unit
     def test_chunks_segment_lengths_tracking(self):
@@ -195,6 +206,12 @@ class TestGetChunk:
                     assert "testuser" in result
                     assert "testhost" in result
 
+    @pytest.mark.unit
+    def test_every_segment_has_a_chunk_method(self):
+        """Test each Segment can be dispatched to a Chunks method."""
+        for segment in Segment:
+            assert callable(getattr(Chunks, f"_chunk_{segment.name.lower()}", None)), segment
+
     @pytest.mark.edge_case
     def test_get_chunk_invalid_segment(self):
         """Test getting invalid segment raises error."""
@@ -225,15 +242,12 @@ class TestGetProjectInfo:
             with patch.dict(os.environ, {"SSH_CLIENT": "", "KITTY_PID": "", "ITERM_SESSION_ID": ""}):
                 with patch("os.get_terminal_size", return_value=os.terminal_size((80, 24))):
                     chunks = Chunks()
+                    chunks.cwd = "/home/user/myproject/src"
                     with patch("prompt.prompt.Path") as mock_path:
                         mock_path.return_value.expanduser.return_value = temp_file
-                        with patch("os.path.curdir", "/home/user/myproject/src"):
-                            with patch("os.path.abspath") as mock_abs:
-                                mock_abs.return_value = "/home/user/myproject/src"
-                                with patch.object(Path, "is_relative_to", return_value=True):
-                                    name, bg, fg = chunks.get_project_info()
-                                    assert name == "myproject"
-                                    assert bg == "#FF0000"
+                        name, bg, fg = chunks.get_project_info()
+                        assert name == "myproject"
+                        assert bg == "#FF0000"
         finally:
             os.unlink(temp_file)
 
@@ -251,18 +265,29 @@ class TestGetProjectInfo:
                     # Mock the config file location
                     with patch("pathlib.Path.expanduser") as mock_expand:
                         mock_expand.return_value = Path(temp_file)
-                        # Mock the current directory to be somewhere not in any project
-                        with patch("os.path.curdir", "/other/location"):
-                            with patch("os.path.abspath") as mock_abs:
-                                mock_abs.return_value = "/other/location"
-                                name, bg, fg = chunks.get_project_info()
-                                # Should return defaults when not in any project
-                                assert name == ""
-                                assert bg == "blue"  # Default
-                                assert fg == "white"  # Default
+                        # Set the current directory to be somewhere not in any project
+                        chunks.cwd = "/other/location"
+                        name, bg, fg = chunks.get_project_info()
+                        # Should return defaults when not in any project
+                        assert name == ""
+                        assert bg == "blue"  # Default
+                        assert fg == "white"  # Default
         finally:
             os.unlink(temp_file)
 
+    @pytest.mark.edge_case
+    def test_get_project_info_sibling_prefix(self, tmp_path):
+        """Test a dir that only shares a name prefix with a project doesn't match."""
+        conf = tmp_path / "projects"
+        conf.write_text("proj\t/home/user/proj\t#FF0000\n")
+        with patch.dict(os.environ, {"SSH_CLIENT": "", "KITTY_PID": "", "ITERM_SESSION_ID": ""}):
+            chunks = Chunks(columns=80)
+            chunks.cwd = "/home/user/project2"
+            with patch("prompt.prompt.Path") as mock_path:
+                mock_path.return_value.expanduser.return_value = conf
+                name = chunks.get_project_info()[0]
+                assert name == ""
+
     @pytest.mark.edge_case
     def test_get_project_info_missing_file(self):
         """Test get_project_info with missing config file."""
@@ -329,6 +354,44 @@ class TestChunkSpecificMethods:
                 assert result == ""
 
 
+class TestChunkPath:
+    """Test the path chunk."""
+
+    def _path_text(self, cwd):
+        chunks = Chunks(columns=200)
+        chunks.cwd = cwd
+        with patch.object(Chunks, "HOME", "/home/user"):
+            result = chunks._chunk_path()
+        return result
+
+    @pytest.mark.unit
+    def test_chunk_path_home_prefix(self):
+        """Test the home dir is shown as ~."""
+        assert "~/projects" in self._path_text("/home/user/projects")
+
+    @pytest.mark.edge_case
+    def test_chunk_path_home_lookalike(self):
+        """Test a sibling dir that starts with the home dir name is left alone."""
+        result = self._path_text("/home/username/projects")
+        assert "/home/username/projects" in result
+        assert "~" not in result
+
+    @pytest.mark.unit
+    def test_chunk_path_links_only_for_terminals(self):
+        """Test the path is only made a hyperlink when a terminal will show it."""
+        chunks = Chunks(columns=200)
+        chunks.cwd = "/tmp/somewhere"
+        chunks.hyperlinks = False
+        assert "\x1b]8;;" not in chunks._chunk_path()
+        chunks.hyperlinks = True
+        assert "\x1b]8;;file:///tmp/somewhere\a" in chunks._chunk_path()
+
+    @pytest.mark.unit
+    def test_chunk_path_spaces_escaped(self):
+        """Test spaces in the path are escaped."""
+        assert r"~/my\ project" in self._path_text("/home/user/my project")
+
+
 class TestGitSkipOptimization:
     """Test that git subprocess is skipped in non-git directories."""
 
@@ -346,14 +409,73 @@ class TestGitSkipOptimization:
                     mock_run.assert_not_called()
 
     @pytest.mark.unit
-    def test_branch_calls_git_when_in_repo(self):
+    def test_branch_calls_git_when_in_repo(self, tmp_path):
         """Test that _chunk_branch does call git when .git marker is present."""
+        git_dir = tmp_path / ".git"
+        (git_dir / "refs" / "heads").mkdir(parents=True)
+        (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+        (git_dir / "refs" / "heads" / "main").write_text("0" * 40 + "\n")
         with patch.dict(os.environ, {"SSH_CLIENT": ""}):
             with patch("os.get_terminal_size", return_value=os.terminal_size((80, 24))):
                 chunks = Chunks()
-                chunks._dir_markers[".git"] = Path("/some/repo/.git")
+                chunks._dir_markers[".git"] = git_dir
 
                 with patch("subprocess.run") as mock_run:
-                    mock_run.return_value.stdout = "## main...origin/main\n"
+                    mock_run.return_value.stdout = " M file.py\n"
+                    mock_run.return_value.returncode = 0
                     result = chunks._chunk_branch()
                     mock_run.assert_called_once()
+                    assert mock_run.call_args.kwargs["env"]["GIT_OPTIONAL_LOCKS"] == "0"
+                    assert "main" in result
+
+    @pytest.mark.edge_case
+    def test_branch_git_timeout_shows_branch_only(self, tmp_path):
+        """Test a slow git status still shows the branch, without the status dot."""
+        import subprocess
+
+        git_dir = tmp_path / ".git"
+        (git_dir / "refs" / "heads").mkdir(parents=True)
+        (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+        (git_dir / "refs" / "heads" / "main").write_text("0" * 40 + "\n")
+        with patch.dict(os.environ, {"SSH_CLIENT": ""}):
+            chunks = Chunks(columns=80)
+            chunks._dir_markers[".git"] = git_dir
+
+            with patch("subprocess.run", side_effect=subprocess.TimeoutExpired("git", 0.15)):
+                result = chunks._chunk_branch()
+                assert "main" in result
+                assert "⏺" not in result
+
+    @pytest.mark.edge_case
+    @pytest.mark.parametrize("value, expected", [("150ms", 0.15), ("-1", 0.0)])
+    def test_branch_bad_git_timeout(self, tmp_path, value, expected):
+        """Test an unusable PROMPT_GIT_TIMEOUT falls back instead of crashing."""
+        git_dir = tmp_path / ".git"
+        (git_dir / "refs" / "heads").mkdir(parents=True)
+        (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+        (git_dir / "refs" / "heads" / "main").write_text("0" * 40 + "\n")
+        with patch.dict(os.environ, {"SSH_CLIENT": "", "PROMPT_GIT_TIMEOUT": value}):
+            chunks = Chunks(columns=80)
+            chunks._dir_markers[".git"] = git_dir
+
+            with patch("subprocess.run") as mock_run:
+                mock_run.return_value.stdout = ""
+                mock_run.return_value.returncode = 0
+                result = chunks._chunk_branch()
+                assert mock_run.call_args.kwargs["timeout"] == expected
+                assert "main" in result
+
+    @pytest.mark.unit
+    def test_branch_skips_git_without_commits(self, tmp_path):
+        """Test that a branch with no commits yet doesn't call git."""
+        git_dir = tmp_path / ".git"
+        git_dir.mkdir()
+        (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+        with patch.dict(os.environ, {"SSH_CLIENT": ""}):
+            with patch("os.get_terminal_size", return_value=os.terminal_size((80, 24))):
+                chunks = Chunks()
+                chunks._dir_markers[".git"] = git_dir
+
+                with patch("subprocess.run") as mock_run:
+                    assert chunks._chunk_branch() == ""
+                    mock_run.assert_not_called()
@@ -2,12 +2,15 @@
 
 import tempfile
 import os
+import shlex
+import subprocess
+import sys
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 from click.testing import CliRunner
-from prompt.ui import prompt
+from prompt.ui import prompt, insert_time
 
 
 class TestPromptCommand:
@@ -34,6 +37,38 @@ class TestPromptCommand:
 class TestPs1Command:
     """Test ps1 subcommand."""
 
+    @pytest.mark.unit
+    def test_ps1_prompt_time(self):
+        """Test PROMPT_TIME adds the build time under the prompt line."""
+        runner = CliRunner()
+        with patch("prompt.ui.ps1_prompt", return_value="line\n$ "):
+            result = runner.invoke(prompt, ["ps1"], env={"PROMPT_TIME": "1"})
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert lines[1] == "line"
+        assert lines[2].endswith(" seconds")
+
+    @pytest.mark.unit
+    def test_main_ps1_skips_click(self, capsys):
+        """Test the console script renders ps1 without the click CLI."""
+        from prompt import main
+
+        with patch("sys.argv", ["prompt", "ps1"]), patch(
+            "prompt.prompt.cached_ps1_prompt", return_value="line\n$ "
+        ), patch("prompt.ui.prompt") as mock_cli:
+            main()
+        assert capsys.readouterr().out == "\nline\n$ \n"
+        mock_cli.assert_not_called()
+
+    @pytest.mark.integration
+    def test_ps1_does_not_import_projects(self):
+        """Test that loading the CLI for ps1 leaves projects.py unimported."""
+        code = "import sys, prompt.ui; print('prompt.projects' in sys.modules)"
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        assert result.stdout.strip() == "False"
+
     @pytest.mark.integration
     def test_ps1_command_runs(self):
         """Test that ps1 command executes."""
@@ -63,6 +98,20 @@ class TestPs1Command:
         assert "Output a PS1 prompt" in result.output
 
 
+class TestInsertTime:
+    """Test the timing line added to a ps1 render."""
+
+    @pytest.mark.unit
+    def test_insert_time_after_first_line(self):
+        """Test the time goes between the prompt line and the dollar line."""
+        assert insert_time("line\n$ ", 0.25) == "line\n0.250000 seconds\n$ "
+
+    @pytest.mark.edge_case
+    def test_insert_time_single_line(self):
+        """Test a render without a newline gets the time appended."""
+        assert insert_time("line", 0.25) == "line\n0.250000 seconds"
+
+
 class TestThemesCommand:
     """Test themes subcommand."""
 
@@ -278,3 +327,49 @@ class TestProjectAddCommand:
                 assert result.exit_code != 0
         finally:
             os.unlink(temp_file)
+
+
+class TestCompletionCommand:
+    """Test completion subcommand."""
+
+    @pytest.mark.integration
+    def test_completion_bash_lists_projects(self):
+        """Test bash completion has the project names built in."""
+        runner = CliRunner()
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".tsv", delete=False) as f:
+            f.write("beta\t/tmp/beta\t#FF0000\n# comment\nalpha\t/tmp/alpha\tred\n")
+            temp_file = f.name
+
+        try:
+            with patch("prompt.projects.CONFIG_FILE", temp_file):
+                result = runner.invoke(prompt, ["completion", "bash"])
+                assert result.exit_code == 0
+                assert result.output == "complete -W 'alpha beta' cdd\n"
+        finally:
+            os.unlink(temp_file)
+
+    @pytest.mark.edge_case
+    def test_completion_name_with_space(self):
+        """Test a project name with a space stays a single candidate."""
+        runner = CliRunner()
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".tsv", delete=False) as f:
+            f.write("my site\t/tmp/site\tred\nalpha\t/tmp/alpha\tred\n")
+            temp_file = f.name
+
+        try:
+            with patch("prompt.projects.CONFIG_FILE", temp_file):
+                bash = runner.invoke(prompt, ["completion", "bash"]).output
+                fish = runner.invoke(prompt, ["completion", "fish"]).output
+            wordlist = shlex.split(bash)[2]
+            assert shlex.split(wordlist) == ["alpha", "my site"]
+            entries = [shlex.split(shlex.split(line)[-1]) for line in fish.splitlines()[1:]]
+            assert entries == [["alpha"], ["my site"]]
+        finally:
+            os.unlink(temp_file)
+
+    @pytest.mark.edge_case
+    def test_completion_unknown_shell(self):
+        """Test an unsupported shell is rejected."""
+        runner = CliRunner()
+        result = runner.invoke(prompt, ["completion", "tcsh"])
+        assert result.exit_code != 0
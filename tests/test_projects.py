@@ -1,5 +1,6 @@
 """Tests for projects.py module."""
 
+import mmap
 import os
 import tempfile
 from pathlib import Path
@@ -13,6 +14,8 @@ from prompt.projects import (
     add_line,
     filter_projects,
     get_random_color,
+    pretty_print,
+    remove,
     ColorParamType,
 )
 
@@ -45,13 +48,65 @@ class TestReadCsv:
                 read_csv()
 
     @pytest.mark.unit
-    def test_read_csv_sorted(self, temp_projects_file):
-        """Test that projects are sorted by path."""
+    def test_read_csv_file_order(self, temp_projects_file):
+        """Test that projects keep the order they have in the file."""
         with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
             data = read_csv()
-            paths = [v[0] for v in data.values()]
-            # Should be sorted (nested comes last)
-            assert paths == sorted(paths)
+            assert list(data) == ["project1", "project2", "nested"]
+
+    @pytest.mark.edge_case
+    def test_read_csv_crlf_and_blank_lines(self, temp_dir):
+        """Test files written with CRLF endings and blank or short lines."""
+        datafile = temp_dir / "projects.tsv"
+        datafile.write_bytes(
+            b"one\t/home/user/one\t#FF0000\r\n"
+            b"\r\n"
+            b"short\t/home/user/short\r\n"
+            b"two\t/home/user/two\t#00FF00\r\n"
+        )
+        with patch("prompt.projects.CONFIG_FILE", str(datafile)):
+            data = read_csv()
+        assert data == {
+            "one": ["/home/user/one", "#FF0000"],
+            "two": ["/home/user/two", "#00FF00"],
+        }
+
+    @pytest.mark.unit
+    def test_read_csv_large_file_mmap(self, temp_projects_file):
+        """Test that large files parsed through mmap give the same result."""
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            read_csv.cache_clear()
+            expected = read_csv()
+            read_csv.cache_clear()
+            with (
+                patch("prompt.projects._MMAP_MIN", 1),
+                patch("prompt.projects.mmap.mmap", wraps=mmap.mmap) as mock_mmap,
+            ):
+                assert read_csv() == expected
+                mock_mmap.assert_called_once()
+
+    @pytest.mark.unit
+    def test_read_csv_cached(self, temp_projects_file):
+        """Test that a second read of an unchanged file skips parsing."""
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            read_csv.cache_clear()
+            first = read_csv()
+            with patch("builtins.open", side_effect=AssertionError("re-read")):
+                second = read_csv()
+            assert first == second
+            # returned dicts are copies so callers can mutate them
+            second["extra"] = ["/tmp", "#000000"]
+            assert "extra" not in read_csv()
+
+    @pytest.mark.unit
+    def test_read_csv_cache_invalidated_on_change(self, temp_projects_file):
+        """Test that the cache is dropped when the file changes."""
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            read_csv.cache_clear()
+            read_csv()
+            with open(temp_projects_file, "a") as f:
+                f.write("added\t/home/user/added\t#123456\n")
+            assert "added" in read_csv()
 
 
 class TestWriteCsv:
@@ -100,6 +155,15 @@ class TestWriteCsv:
         finally:
             os.unlink(temp_file)
 
+    @pytest.mark.unit
+    def test_write_csv_primes_cache(self, temp_projects_file):
+        """Test that reading right after a write doesn't re-parse the file."""
+        test_data = {"project1": ["/path/to/project1", "#FF0000"]}
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            write_csv(test_data)
+            with patch("builtins.open", side_effect=AssertionError("re-read")):
+                assert read_csv() == test_data
+
 
 class TestGetProjectDir:
     """Test project directory detection."""
@@ -138,8 +202,8 @@ class TestGetProjectDir:
     def test_path_prefix_issue(self):
         """Test that /home/myproject2 doesn't match /home/myproject.
 
-        Uses Path.is_relative_to() for proper path component matching
-        instead of string prefix matching.
+        Paths are compared with a trailing separator so only whole path
+        components match.
         """
         projects = {
             "myproject": ["/home/myproject", "#FF0000"],
@@ -150,22 +214,25 @@ class TestGetProjectDir:
 
     @pytest.mark.unit
     def test_multiple_projects_selects_closest(self):
-        """Test that closest (longest) matching path is selected.
-
-        Note: This test demonstrates a bug in the current implementation.
-        The code should select the longest/most specific match, but due to
-        the string prefix matching issue, it returns the first match.
-        This will be fixed when switching to Path.is_relative_to().
-        """
+        """Test that closest (longest) matching path is selected."""
         projects = {
             "parent": ["/home/user", "#FF0000"],
             "child": ["/home/user/projects", "#00FF00"],
         }
         with patch("os.path.realpath", return_value="/home/user/projects/myproj/src"):
             result = get_project_dir(projects)
-            # Currently returns parent due to iteration order, should return child
-            # TODO: Fix by using Path.is_relative_to() and selecting longest match
-            assert result == "/home/user"  # Current buggy behavior
+            assert result == "/home/user/projects"
+
+    @pytest.mark.edge_case
+    def test_in_nested_project_root(self):
+        """Test that the root of a nested project isn't mistaken for a subdir."""
+        projects = {
+            "parent": ["/home/user", "#FF0000"],
+            "child": ["/home/user/projects", "#00FF00"],
+        }
+        with patch("os.path.realpath", return_value="/home/user/projects"):
+            result = get_project_dir(projects)
+            assert result is False
 
 
 class TestAddLine:
@@ -182,6 +249,46 @@ class TestAddLine:
             assert data["newproject"][0] == "/home/user/new"
             assert data["newproject"][1] == "#AABBCC"
 
+    @pytest.mark.unit
+    def test_add_new_project_appends(self, temp_projects_file):
+        """Test that a new project is appended without rewriting the file."""
+        with open(temp_projects_file) as f:
+            original = f.read()
+        with (
+            patch("prompt.projects.CONFIG_FILE", temp_projects_file),
+            patch("prompt.projects.write_csv") as mock_write,
+        ):
+            add_line("newproject", Path("/home/user/new"), "#AABBCC")
+            mock_write.assert_not_called()
+        with open(temp_projects_file) as f:
+            content = f.read()
+        assert content == original + "newproject\t/home/user/new\t#AABBCC\n"
+
+    @pytest.mark.edge_case
+    def test_add_new_project_missing_final_newline(self, temp_projects_file):
+        """Test appending to a file that doesn't end with a newline."""
+        with open(temp_projects_file, "a") as f:
+            f.write("last\t/home/user/last\t#111111")
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            add_line("newproject", Path("/home/user/new"), "#AABBCC")
+            read_csv.cache_clear()
+            data = read_csv()
+            assert data["last"] == ["/home/user/last", "#111111"]
+            assert data["newproject"] == ["/home/user/new", "#AABBCC"]
+
+    @pytest.mark.edge_case
+    def test_add_project_with_tab_fails(self, temp_projects_file):
+        """Test that a tab in the name is rejected instead of corrupting the file."""
+        with open(temp_projects_file) as f:
+            original = f.read()
+        with (
+            patch("prompt.projects.CONFIG_FILE", temp_projects_file),
+            pytest.raises(SystemExit),
+        ):
+            add_line("bad\tname", Path("/home/user/new"), "#AABBCC")
+        with open(temp_projects_file) as f:
+            assert f.read() == original
+
     @pytest.mark.unit
     def test_update_existing_project_color(self, temp_projects_file):
         """Test updating an existing project's color."""
@@ -252,6 +359,86 @@ class TestFilterProjects:
         assert len(result) == 0
 
 
+class TestPrettyPrint:
+    """Test project listing output."""
+
+    @pytest.mark.unit
+    def test_pretty_print_writes_to_stderr(self, capsys):
+        """Test that the listing stays off stdout, which cdd evals."""
+        projects = {
+            "odd": ['/tmp/100% "quoted"', "#FF0000"],
+        }
+        pretty_print(projects)
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        assert "odd" in captured.err
+        assert '/tmp/100% "quoted"' in captured.err
+        assert "printf" not in captured.err
+
+    @pytest.mark.unit
+    def test_pretty_print_marks_missing(self, temp_dir, capsys):
+        """Test that only projects whose dir is gone are shown in red."""
+        (temp_dir / "here").mkdir()
+        projects = {
+            "here": [str(temp_dir / "here"), "#FF0000"],
+            "gone": [str(temp_dir / "gone"), "#00FF00"],
+            "nowhere": ["/nonexistent/parent/gone", "#0000FF"],
+        }
+        pretty_print(projects)
+        lines = {
+            line.split()[0].replace("\x1b[1m", ""): line
+            for line in capsys.readouterr().err.splitlines()
+        }
+        assert "31m" not in lines["here"]
+        assert "31m" in lines["gone"]
+        assert "31m" in lines["nowhere"]
+
+    @pytest.mark.edge_case
+    def test_pretty_print_unlistable_parent(self, temp_dir, capsys):
+        """Test projects under a dir that can't be listed aren't marked missing."""
+        (temp_dir / "here").mkdir()
+        projects = {"here": [str(temp_dir / "here"), "#FF0000"]}
+        with patch("prompt.projects.os.scandir", side_effect=PermissionError):
+            pretty_print(projects)
+        assert "31m" not in capsys.readouterr().err
+
+    @pytest.mark.edge_case
+    def test_pretty_print_dangling_symlink(self, temp_dir, capsys):
+        """Test a project dir that is a dangling symlink is marked missing."""
+        (temp_dir / "link").symlink_to(temp_dir / "gone")
+        projects = {"link": [str(temp_dir / "link"), "#FF0000"]}
+        pretty_print(projects)
+        assert "31m" in capsys.readouterr().err
+
+    @pytest.mark.edge_case
+    def test_pretty_print_case_mismatch(self, temp_dir, capsys):
+        """Test a dir listed in another case isn't marked missing.
+
+        On a case-insensitive filesystem the listing shows "here" while the
+        project saved "HERE", so existence has to come from a stat.
+        """
+        (temp_dir / "here").mkdir()
+        projects = {"HERE": [str(temp_dir / "HERE"), "#FF0000"]}
+        real_exists = os.path.exists
+        with patch(
+            "prompt.projects.os.path.exists",
+            side_effect=lambda path: real_exists(str(path).replace("HERE", "here")),
+        ):
+            pretty_print(projects)
+        assert "31m" not in capsys.readouterr().err
+
+    @pytest.mark.unit
+    def test_pretty_print_sorted_by_path(self, capsys):
+        """Test that the listing is sorted by path."""
+        projects = {
+            "zed": ["/a/zed", "#FF0000"],
+            "alpha": ["/b/alpha", "#00FF00"],
+        }
+        pretty_print(projects)
+        err = capsys.readouterr().err
+        assert err.index("zed") < err.index("alpha")
+
+
 class TestGetRandomColor:
     """Test random color generation."""
 
@@ -318,3 +505,44 @@ class TestColorParamType:
         param_type = ColorParamType()
         with pytest.raises(Exception):
             param_type.convert("#GGGGGG", None, None)
+
+
+class TestRemove:
+    """Test removing project entries."""
+
+    @pytest.mark.unit
+    def test_remove_project(self, temp_projects_file):
+        """Test that only the named project is removed."""
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            remove("project1")
+
+        with open(temp_projects_file) as f:
+            content = f.read()
+        assert "project1\t" not in content
+        assert "project2\t" in content
+        assert "# Test projects file" in content
+        assert not os.path.exists(temp_projects_file + ".tmp")
+
+    @pytest.mark.edge_case
+    def test_remove_is_exact_name(self, temp_projects_file):
+        """Test that a name prefix doesn't remove other projects."""
+        with patch("prompt.projects.CONFIG_FILE", temp_projects_file):
+            remove("project")
+
+        with open(temp_projects_file) as f:
+            content = f.read()
+        assert "project1\t" in content
+        assert "project2\t" in content
+
+    @pytest.mark.edge_case
+    def test_remove_keeps_permissions(self, tmp_path):
+        """Test that rewriting the file keeps its mode and leaves no tmp file."""
+        datafile = tmp_path / "projects"
+        datafile.write_text("project1\t/a\t#FF0000\nproject2\t/b\t#00FF00\n")
+        datafile.chmod(0o640)
+        with patch("prompt.projects.CONFIG_FILE", str(datafile)):
+            remove("project1")
+
+        assert datafile.stat().st_mode & 0o777 == 0o640
+        assert datafile.read_text() == "project2\t/b\t#00FF00\n"
+        assert os.listdir(tmp_path) == ["projects"]
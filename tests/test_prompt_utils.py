@@ -8,8 +8,18 @@ from prompt.prompt import (
     snip,
     find_dir_upwards,
     Ellipses,
+    load_projects,
+    read_git_branch,
+    ddev_status,
+    rgb_to_256,
+    style_codes,
+    set_kitty_tabs,
+    cached_ps1_prompt,
+    scan_parent_dirs,
 )
 from pathlib import Path
+from unittest.mock import patch
+import os
 import tempfile
 
 
@@ -161,6 +171,13 @@ class TestSnip:
         result = snip(string, 20, "…")
         assert result == ("exactly20characterss", "")
 
+    @pytest.mark.edge_case
+    def test_snip_no_room_for_end(self):
+        """Test the end is empty rather than the whole string when there's no room."""
+        start, end = snip("/home/user/long", 1, "…", position=0.25)
+        assert start == ""
+        assert end == ""
+
     @pytest.mark.edge_case
     def test_snip_very_small_length(self):
         """Test snipping to very small length."""
@@ -216,6 +233,15 @@ class TestFindDirUpwards:
             )
             assert result is None
 
+    @pytest.mark.edge_case
+    def test_find_dir_stop_at_trailing_slash(self, tmp_path):
+        """Test that a stop_at with a trailing slash still stops the search."""
+        (tmp_path / "target").mkdir()
+        search_from = tmp_path / "a"
+        search_from.mkdir()
+        result = find_dir_upwards(search_from, "target", stop_at=f"{tmp_path}/")
+        assert result is None
+
     @pytest.mark.edge_case
     def test_find_dir_multiple_levels_up(self):
         """Test finding directory multiple levels up."""
@@ -264,3 +290,294 @@ class TestEllipses:
         assert e.unicode_ellipsis == "…"
         assert e.bar == "|"
         assert e.large_square == "▉"
+
+
+class TestLoadProjects:
+    """Test the projects file loader."""
+
+    @pytest.mark.unit
+    def test_load_projects_parses_rows(self, tmp_path):
+        """Test rows are parsed and comments skipped."""
+        conf = tmp_path / "projects"
+        conf.write_text("# comment\nproj\t/some/path\t#FF0000\n\n")
+        assert load_projects(conf) == [("proj", "/some/path", "#FF0000")]
+
+    @pytest.mark.edge_case
+    def test_load_projects_skips_short_rows(self, tmp_path):
+        """Test rows without a dir and a color are skipped."""
+        conf = tmp_path / "projects"
+        conf.write_text("short\t/some/path\nproj\t/some/path\t#FF0000\n")
+        assert load_projects(conf) == [("proj", "/some/path", "#FF0000")]
+
+    @pytest.mark.edge_case
+    def test_load_projects_crlf(self, tmp_path):
+        """Test CRLF line endings are stripped from the color."""
+        conf = tmp_path / "projects"
+        conf.write_bytes(b"proj\t/some/path\t#FF0000\r\n")
+        assert load_projects(conf) == [("proj", "/some/path", "#FF0000")]
+
+    @pytest.mark.unit
+    def test_load_projects_resolves_dirs(self, tmp_path, monkeypatch):
+        """Test project dirs are expanded from ~ and symlinks resolved."""
+        monkeypatch.setenv("HOME", str(tmp_path))
+        real = tmp_path / "real"
+        real.mkdir()
+        (tmp_path / "link").symlink_to(real)
+        conf = tmp_path / "projects"
+        conf.write_text("proj\t~/link\t#FF0000\n")
+        assert load_projects(conf) == [("proj", os.path.realpath(real), "#FF0000")]
+
+    @pytest.mark.edge_case
+    def test_load_projects_missing_file(self, tmp_path):
+        """Test a missing projects file raises FileNotFoundError."""
+        with pytest.raises(FileNotFoundError):
+            load_projects(tmp_path / "missing")
+
+
+class TestReadGitBranch:
+    """Test reading the current branch from HEAD."""
+
+    @pytest.mark.unit
+    def test_branch_from_loose_ref(self, tmp_path):
+        """Test a branch with a loose ref."""
+        (tmp_path / "refs" / "heads").mkdir(parents=True)
+        (tmp_path / "HEAD").write_text("ref: refs/heads/feature/x\n")
+        (tmp_path / "refs" / "heads" / "feature").mkdir()
+        (tmp_path / "refs" / "heads" / "feature" / "x").write_text("0" * 40)
+        assert read_git_branch(tmp_path) == "feature/x"
+
+    @pytest.mark.unit
+    def test_branch_from_packed_refs(self, tmp_path):
+        """Test a branch that only exists in packed-refs."""
+        (tmp_path / "HEAD").write_text("ref: refs/heads/main\n")
+        (tmp_path / "packed-refs").write_text(f"{'0' * 40} refs/heads/main\n")
+        assert read_git_branch(tmp_path) == "main"
+
+    @pytest.mark.unit
+    def test_detached_head(self, tmp_path):
+        """Test a detached HEAD gives the short sha."""
+        (tmp_path / "HEAD").write_text("abcdef0123456789\n")
+        assert read_git_branch(tmp_path) == "abcdef0"
+
+    @pytest.mark.unit
+    def test_worktree_git_file(self, tmp_path):
+        """Test a worktree .git file pointing into a bare repo."""
+        bare = tmp_path / ".bare"
+        worktree_dir = bare / "worktrees" / "wt"
+        worktree_dir.mkdir(parents=True)
+        (worktree_dir / "HEAD").write_text("ref: refs/heads/wt\n")
+        (worktree_dir / "commondir").write_text("../..\n")
+        (bare / "refs" / "heads").mkdir(parents=True)
+        (bare / "refs" / "heads" / "wt").write_text("0" * 40)
+        git_file = tmp_path / "wt" / ".git"
+        git_file.parent.mkdir()
+        git_file.write_text(f"gitdir: {worktree_dir}\n")
+        assert read_git_branch(git_file) == "wt"
+
+    @pytest.mark.edge_case
+    def test_no_commits_yet(self, tmp_path):
+        """Test an unborn branch returns None."""
+        (tmp_path / "HEAD").write_text("ref: refs/heads/main\n")
+        assert read_git_branch(tmp_path) is None
+
+    @pytest.mark.edge_case
+    def test_missing_head(self, tmp_path):
+        """Test an unreadable repo returns None."""
+        assert read_git_branch(tmp_path / "nope") is None
+
+
+class TestDdevStatus:
+    """Test the cached ddev status lookup."""
+
+    @pytest.fixture
+    def ddev_dir(self, tmp_path):
+        ddev_dir = tmp_path / "project" / ".ddev"
+        ddev_dir.mkdir(parents=True)
+        return ddev_dir
+
+    @pytest.mark.unit
+    def test_ddev_status_runs_ddev_without_cache(self, ddev_dir):
+        """Test ddev is run once and its output cached."""
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value.stdout = '{"raw": {"status": "running"}}'
+            assert ddev_status(ddev_dir) == "running"
+            assert ddev_status(ddev_dir) == "running"
+            mock_run.assert_called_once()
+
+    @pytest.mark.unit
+    def test_ddev_status_stale_cache_refreshes_in_background(self, ddev_dir):
+        """Test a stale cache is used while ddev runs in the background."""
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value.stdout = '{"raw": {"status": "stopped"}}'
+            ddev_status(ddev_dir)
+        (ddev_dir / ".ddev-docker-compose-full.yaml").touch()
+        os.utime(ddev_dir / ".ddev-docker-compose-full.yaml", (2**31, 2**31))
+        with patch("subprocess.run") as mock_run, patch("subprocess.Popen") as mock_popen:
+            assert ddev_status(ddev_dir) == "stopped"
+            mock_run.assert_not_called()
+            mock_popen.assert_called_once()
+
+    @pytest.mark.edge_case
+    def test_ddev_status_unwritable_cache(self, ddev_dir):
+        """Test a cache that can't be touched is used without a refresh."""
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value.stdout = '{"raw": {"status": "stopped"}}'
+            ddev_status(ddev_dir)
+        (ddev_dir / ".ddev-docker-compose-full.yaml").touch()
+        os.utime(ddev_dir / ".ddev-docker-compose-full.yaml", (2**31, 2**31))
+        with patch("os.utime", side_effect=PermissionError), patch(
+            "subprocess.Popen"
+        ) as mock_popen:
+            assert ddev_status(ddev_dir) == "stopped"
+            mock_popen.assert_not_called()
+
+    @pytest.mark.edge_case
+    def test_ddev_status_bad_output(self, ddev_dir, capsys):
+        """Test unreadable ddev output returns None."""
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value.stdout = "not json"
+            assert ddev_status(ddev_dir) is None
+
+
+class TestRgbTo256:
+    """Test reducing RGB colors to the xterm 256 color palette."""
+
+    @pytest.mark.unit
+    def test_cube_colors(self):
+        """Test colors that are exactly in the color cube."""
+        assert rgb_to_256((255, 0, 0)) == 196
+        assert rgb_to_256((0, 0, 255)) == 21
+        assert rgb_to_256((95, 135, 175)) == 67
+
+    @pytest.mark.unit
+    def test_grey_colors(self):
+        """Test greys use the grey ramp."""
+        assert rgb_to_256((128, 128, 128)) == 244
+        assert rgb_to_256((8, 8, 8)) == 232
+
+    @pytest.mark.edge_case
+    def test_black_and_white(self):
+        """Test extremes map to the cube corners."""
+        assert rgb_to_256((0, 0, 0)) == 16
+        assert rgb_to_256((255, 255, 255)) == 231
+
+    @pytest.mark.unit
+    def test_style_codes_without_truecolor(self):
+        """Test RGB styles fall back to 256 color codes."""
+        with patch("prompt.prompt.TRUECOLOR", False):
+            codes = style_codes.__wrapped__((255, 0, 0), "")
+        assert "38;5;196" in codes
+
+    @pytest.mark.unit
+    def test_style_codes_with_truecolor(self):
+        """Test RGB styles are kept as is on truecolor terminals."""
+        with patch("prompt.prompt.TRUECOLOR", True):
+            codes = style_codes.__wrapped__((255, 0, 0), "")
+        assert "38;2;255;0;0" in codes
+
+
+class TestSetKittyTabs:
+    """Test the kitty tab title and color commands."""
+
+    @pytest.mark.unit
+    def test_kitty_socket_runs_commands_together(self, monkeypatch):
+        """Test both kittens are started before waiting when a socket is set."""
+        monkeypatch.setenv("KITTY_LISTEN_ON", "unix:/tmp/kitty")
+        with patch("subprocess.Popen") as mock_popen, patch("subprocess.call") as mock_call:
+            set_kitty_tabs("proj", "#336699", "#99ccff", Path("/a/b"), "")
+            assert mock_popen.call_count == 2
+            assert mock_popen.return_value.wait.call_count == 2
+            mock_call.assert_not_called()
+
+    @pytest.mark.unit
+    def test_kitty_tty_runs_commands_in_turn(self, monkeypatch):
+        """Test the kittens run one after the other without a socket."""
+        monkeypatch.delenv("KITTY_LISTEN_ON", raising=False)
+        with patch("subprocess.Popen") as mock_popen, patch("subprocess.call") as mock_call:
+            set_kitty_tabs("proj", "#336699", "#99ccff", Path("/a/b"), "")
+            assert mock_call.call_count == 2
+            assert mock_call.call_args_list[0].args[0][2] == "set-tab-title"
+            mock_popen.assert_not_called()
+
+
+    @pytest.mark.unit
+    def test_kitty_socket_from_env_snapshot(self, monkeypatch):
+        """Test the socket is looked up in the env passed in."""
+        monkeypatch.delenv("KITTY_LISTEN_ON", raising=False)
+        env = {"KITTY_LISTEN_ON": "unix:/tmp/kitty"}
+        with patch("subprocess.Popen") as mock_popen, patch("subprocess.call") as mock_call:
+            set_kitty_tabs("proj", "#336699", "#99ccff", Path("/a/b"), "", None, env)
+            assert mock_popen.call_count == 2
+            mock_call.assert_not_called()
+
+
+class TestCachedPs1Prompt:
+    """Test reusing the last prompt render."""
+
+    @pytest.fixture
+    def workdir(self, tmp_path, monkeypatch):
+        workdir = tmp_path / "work"
+        workdir.mkdir()
+        monkeypatch.chdir(workdir)
+        monkeypatch.setenv("COLUMNS", "80")
+        return workdir
+
+    @pytest.mark.unit
+    def test_repeat_render_uses_cache(self, workdir):
+        """Test an unchanged state within the TTL reuses the last render."""
+        with patch("prompt.prompt.ps1_prompt", return_value="line\n$ ") as mock_ps1:
+            assert cached_ps1_prompt() == "line\n$ "
+            assert cached_ps1_prompt() == "line\n$ "
+            mock_ps1.assert_called_once()
+
+    @pytest.mark.unit
+    def test_miss_renders_with_the_keyed_chunks(self, workdir):
+        """Test a miss renders with the Chunks the key was built from."""
+        with (
+            patch("prompt.prompt.scan_parent_dirs", wraps=scan_parent_dirs) as scan,
+            patch("prompt.prompt.ps1_prompt", return_value="line") as mock_ps1,
+        ):
+            cached_ps1_prompt()
+        scan.assert_called_once()
+        (chunks,) = mock_ps1.call_args.args
+        assert chunks.cwd == os.getcwd()
+        assert chunks.columns == 80
+
+    @pytest.mark.unit
+    def test_changed_environment_renders_again(self, workdir, monkeypatch):
+        """Test a changed environment isn't served the cached render."""
+        with patch("prompt.prompt.ps1_prompt", side_effect=["one", "two"]):
+            assert cached_ps1_prompt() == "one"
+            monkeypatch.setenv("VIRTUAL_ENV", str(workdir))
+            assert cached_ps1_prompt() == "two"
+
+    @pytest.mark.unit
+    def test_expired_cache_renders_again(self, workdir):
+        """Test a render older than the TTL isn't reused."""
+        with patch("prompt.prompt.PS1_CACHE_TTL", 0), patch(
+            "prompt.prompt.ps1_prompt", side_effect=["one", "two"]
+        ):
+            assert cached_ps1_prompt() == "one"
+            assert cached_ps1_prompt() == "two"
+
+    @pytest.mark.edge_case
+    def test_worktree_head_change_renders_again(self, workdir):
+        """Test a .git file's HEAD is part of the key, as for worktrees."""
+        real_git_dir = workdir.parent / "repo.git"
+        real_git_dir.mkdir()
+        (real_git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+        (workdir / ".git").write_text(f"gitdir: {real_git_dir}\n")
+        with patch("prompt.prompt.ps1_prompt", side_effect=["one", "two"]):
+            assert cached_ps1_prompt() == "one"
+            (real_git_dir / "HEAD").write_text("ref: refs/heads/other\n")
+            os.utime(real_git_dir / "HEAD", ns=(0, 0))
+            assert cached_ps1_prompt() == "two"
+
+    @pytest.mark.unit
+    def test_hyperlink_change_renders_again(self, workdir):
+        """Test a render with links isn't reused where links are off."""
+        with patch("prompt.prompt.ps1_prompt", side_effect=["one", "two"]):
+            with patch("prompt.prompt.hyperlinks_enabled", return_value=True):
+                assert cached_ps1_prompt() == "one"
+            with patch("prompt.prompt.hyperlinks_enabled", return_value=False):
+                assert cached_ps1_prompt() == "two"
@@ -270,10 +270,10 @@ class TestChunksWidthCalculation:
     def test_chunks_respects_passed_width(self):
         """Test that Chunks respects width parameter."""
         chunks_80 = Chunks(columns="80")
-        assert chunks_80.columns == "80"
+        assert chunks_80.columns == 80
 
         chunks_120 = Chunks(columns="120")
-        assert chunks_120.columns == "120"
+        assert chunks_120.columns == 120
 
     @pytest.mark.unit
     def test_get_length_with_different_widths(self):